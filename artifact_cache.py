@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "output/artifacts")
+ARTIFACT_CACHE_MB = float(os.getenv("ARTIFACT_CACHE_MB", "512"))
+# Partial files older than this are left over from an interrupted render, not in progress
+STALE_PART_SECONDS = 3600
+
+class ArtifactCache:
+    """Content-addressed store of generated documents.
+
+    An artifact is the filled .docx of one template with one set of values, plus its
+    preview HTML when a full preview was rendered, stored under a key hashing both.
+    Identical generate requests, from the same session or any other, reuse the files
+    instead of rendering again. Artifacts are evicted least recently used first once
+    they take more than max_bytes on disk; the index is rebuilt from the directory
+    (by modification time) at startup.
+    """
+
+    def __init__(self, root: str = ARTIFACT_CACHE_DIR, max_bytes: int = int(ARTIFACT_CACHE_MB * 1024 * 1024)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()     # key -> bytes on disk
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(template_hash: str, values: Dict[str, str]) -> str:
+        """Key of the template (its SHA-256) filled with values, independent of their order"""
+        canonical = json.dumps(values, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(f"{template_hash}\n{canonical}".encode()).hexdigest()
+
+    def document_path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.docx")
+
+    def _preview_path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.html")
+
+    def part_path(self, key: str) -> str:
+        """Where a worker writes a new document before add() moves it into place"""
+        return os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.part")
+
+    def _load(self):
+        found = {}
+        for name in os.listdir(self.root):
+            key, ext = os.path.splitext(name)
+            path = os.path.join(self.root, name)
+            if name.startswith("."):
+                if time.time() - os.path.getmtime(path) > STALE_PART_SECONDS:
+                    os.remove(path)
+            elif ext in (".docx", ".html"):
+                stat = os.stat(path)
+                size, mtime = found.get(key, (0, 0))
+                found[key] = (size + stat.st_size, max(mtime, stat.st_mtime))
+        for key, (size, _) in sorted(found.items(), key=lambda item: item[1][1]):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def _touch(self, key: str):
+        self.entries.move_to_end(key)
+        try:
+            os.utime(self.document_path(key))
+        except OSError:
+            pass
+
+    def _forget(self, key: str):
+        self.total_bytes -= self.entries.pop(key, 0)
+        for path in (self.document_path(key), self._preview_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def has_document(self, key: str) -> bool:
+        with self._lock:
+            if key not in self.entries:
+                return False
+            if not os.path.exists(self.document_path(key)):
+                # Removed by another app worker sharing the directory
+                self._forget(key)
+                return False
+            self._touch(key)
+            return True
+
+    def get_preview(self, key: str) -> Optional[str]:
+        """Preview HTML of a stored artifact, None (a miss) unless both files are present"""
+        if self.has_document(key) and os.path.exists(self._preview_path(key)):
+            with open(self._preview_path(key), encoding="utf-8") as f:
+                preview = f.read()
+            self.hits += 1
+            return preview
+        self.misses += 1
+        return None
+
+    def add(self, key: str, part_path: Optional[str] = None, preview: Optional[str] = None):
+        """Store a rendered document (moved from part_path) and/or its preview, then evict down to max_bytes"""
+        with self._lock:
+            if part_path is not None:
+                os.replace(part_path, self.document_path(key))
+            if preview is not None:
+                part = f"{self.part_path(key)}.html"
+                with open(part, "w", encoding="utf-8") as f:
+                    f.write(preview)
+                os.replace(part, self._preview_path(key))
+            size = sum(
+                os.path.getsize(path) for path in (self.document_path(key), self._preview_path(key))
+                if os.path.exists(path)
+            )
+            self.total_bytes += size - self.entries.get(key, 0)
+            self.entries[key] = size
+            self.entries.move_to_end(key)
+            # The artifact just added is kept even when it alone is over the cap
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                oldest = next(iter(self.entries))
+                self._forget(oldest)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,203 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+from document_pool import DOCUMENT_WORKERS, DocumentPool, DocumentPoolBusy, fill_document
+from placeholder_groups import expand_values
+
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "5000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(max(DOCUMENT_WORKERS, 1))))
+BATCH_HISTORY = 100
+
+# A row is either its values or the reason it could not be read
+Row = Tuple[Optional[Dict[str, str]], Optional[str]]
+
+def read_value_rows(stream: BinaryIO, filename: str, max_rows: int = BATCH_MAX_ROWS) -> List[Row]:
+    """Value sets from a CSV (header row = placeholder names) or JSONL (one object per line) file"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    rows: List[Row] = []
+
+    if filename.endswith((".jsonl", ".ndjson")):
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                values = json.loads(line)
+            except json.JSONDecodeError as e:
+                rows.append((None, f"Invalid JSON: {e.msg}"))
+            else:
+                if isinstance(values, dict):
+                    rows.append(({k: "" if v is None else str(v) for k, v in values.items()}, None))
+                else:
+                    rows.append((None, "Each line must be a JSON object"))
+            if len(rows) > max_rows:
+                break
+    elif filename.endswith(".csv"):
+        reader = csv.DictReader(text)
+        for record in reader:
+            if any(v is None for v in record.values()):
+                # DictReader fills the cells missing from a short row with None
+                cells = sum(v is not None for k, v in record.items() if k is not None)
+                rows.append((None, f"Row has only {cells} of the {len(reader.fieldnames)} columns"))
+            else:
+                # Cells beyond the header end up under the None key
+                rows.append(({k.strip(): v.strip() for k, v in record.items() if k is not None}, None))
+            if len(rows) > max_rows:
+                break
+    else:
+        raise ValueError("Values must be a .csv or .jsonl file")
+
+    if len(rows) > max_rows:
+        raise ValueError(f"At most {max_rows} rows per batch")
+    return rows
+
+class ZipStream:
+    """Write-only file for zipfile: each call returns the archive bytes produced since the last one.
+
+    zipfile falls back to data descriptors when its file cannot seek, so the archive
+    can be sent while it is being written and only one member is held in memory.
+    """
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.zip = zipfile.ZipFile(self, "w", zipfile.ZIP_STORED)
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+    def add(self, name: str, data: bytes) -> bytes:
+        # .docx files are already deflated, storing them saves CPU for nothing lost
+        self.zip.writestr(name, data)
+        return self._take()
+
+    def close(self) -> bytes:
+        self.zip.close()
+        return self._take()
+
+class BatchJob:
+    """Progress and per-row errors of one /api/batch-generate request"""
+
+    def __init__(self, total: int):
+        self.batch_id = str(uuid.uuid4())
+        self.total = total
+        self.succeeded = 0
+        self.errors: List[Dict] = []
+        self.done = False
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def fail(self, row: int, error: str):
+        self.errors.append({"row": row, "error": error})
+
+    def to_dict(self) -> Dict:
+        end = self.finished_at or time.time()
+        return {
+            "batch_id": self.batch_id,
+            "total": self.total,
+            "processed": self.succeeded + len(self.errors),
+            "succeeded": self.succeeded,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda e: e["row"]),
+            "done": self.done,
+            "elapsed_seconds": round(end - self.started_at, 3)
+        }
+
+# Recent batches of this worker, for the progress endpoint
+batch_jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+
+def register_batch(job: BatchJob):
+    batch_jobs[job.batch_id] = job
+    while len(batch_jobs) > BATCH_HISTORY:
+        batch_jobs.popitem(last=False)
+
+def safe_filename(name: str) -> str:
+    """name reduced to characters that are safe in ZIP members and headers"""
+    return re.sub(r'[^A-Za-z0-9_\-. ]+', '_', name).strip(" .")
+
+def _document_name(row: int, values: Dict[str, str], stem: str, name_column: Optional[str]) -> str:
+    name = safe_filename(values.get(name_column, "")) if name_column else ""
+    name = name or stem
+    # The row number keeps names unique even when the name column repeats
+    return f"{row:04d}_{name}.docx"
+
+async def _fill(pool: DocumentPool, file_path: str, values: Dict[str, str]) -> bytes:
+    while True:
+        try:
+            return await pool.run(fill_document, file_path, values)
+        except DocumentPoolBusy as busy:
+            # Interactive requests keep priority; wait for room instead of failing the row
+            await asyncio.sleep(busy.retry_after)
+
+async def stream_batch(pool: DocumentPool, job: BatchJob, file_path: str, placeholders: List[str],
+                       rows: List[Row], stem: str, name_column: Optional[str] = None,
+                       concurrency: int = BATCH_CONCURRENCY,
+                       groups: Optional[Dict[str, List[str]]] = None) -> AsyncIterator[bytes]:
+    """Fill every row in parallel and yield the ZIP as documents finish.
+
+    Rows are rendered at most `concurrency` at a time, so memory stays bounded by the
+    documents in flight. Rows that fail are recorded on the job and listed in the
+    report.json written at the end of the archive. A column named after any variant of
+    a grouped placeholder fills the whole group.
+    """
+    archive = ZipStream()
+    pending: Dict[asyncio.Task, Tuple[int, str]] = {}
+    next_rows = iter(enumerate(rows, start=1))
+
+    def start_more():
+        while len(pending) < concurrency:
+            item = next(next_rows, None)
+            if item is None:
+                return
+            row, (values, error) = item
+            if error is None:
+                # An empty cell is a missing value, not a blank to fill in
+                values = expand_values({k: v for k, v in values.items() if v.strip()}, groups or {})
+                missing = [p for p in placeholders if p not in values]
+                if missing:
+                    error = f"Missing values for: {', '.join(missing)}"
+            if error is not None:
+                job.fail(row, error)
+                continue
+            task = asyncio.ensure_future(_fill(pool, file_path, values))
+            pending[task] = (row, _document_name(row, values, stem, name_column))
+
+    try:
+        start_more()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                row, name = pending.pop(task)
+                try:
+                    data = task.result()
+                except Exception as e:
+                    job.fail(row, str(e) or type(e).__name__)
+                    continue
+                job.succeeded += 1
+                yield archive.add(name, data)
+            start_more()
+
+        job.done = True
+        job.finished_at = time.time()
+        yield archive.add("report.json", json.dumps(job.to_dict(), indent=2).encode())
+        yield archive.close()
+        print(f"Batch {job.batch_id}: {job.succeeded}/{job.total} documents, {len(job.errors)} errors")
+    finally:
+        # The client went away: stop rendering rows nobody will receive
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,78 @@
+"""Check that concurrent /api/chat calls overlap instead of queueing.
+
+Starts the fake LLM server, points the app at it and sends N chats at once
+from N sessions. With a non-blocking LLM path the batch finishes in about one
+LLM latency (validation + next question), not N of them.
+
+    python -m benchmarks.concurrent_chat --sessions 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+
+from docx import Document
+
+from benchmarks.fake_llm import FakeLLMServer
+
+
+def make_template() -> bytes:
+    doc = Document()
+    doc.add_paragraph("This agreement is made by [COMPANY_NAME] on {effective_date}.")
+    doc.add_paragraph("The investor, {investor_name}, invests ${purchase_amount}.")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+async def run(sessions: int, latency: float) -> int:
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        template = make_template()
+        session_ids = []
+        for _ in range(sessions):
+            files = {"file": ("template.docx", template)}
+            response = await client.post("/api/upload", files=files)
+            response.raise_for_status()
+            session_ids.append(response.json()["session_id"])
+
+        async def chat(session_id):
+            response = await client.post("/api/chat", json={"session_id": session_id, "message": "Acme, Inc."})
+            response.raise_for_status()
+            return response.json()
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(chat(s) for s in session_ids))
+        elapsed = time.perf_counter() - start
+
+    # One chat costs validation + next question
+    serial_cost = 2 * latency
+    print(f"{sessions} concurrent chats: {elapsed:.2f}s "
+          f"(one chat ~{serial_cost:.2f}s, fully serialized ~{serial_cost * sessions:.2f}s)")
+    ok = all(r["type"] == "next_question" for r in results) and elapsed < serial_cost * 2
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with FakeLLMServer(latency=args.latency, port=args.port) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        # Measure the LLM path, not the local fast-path validator
+        os.environ["LOCAL_VALIDATION"] = "0"
+        sys.exit(asyncio.run(run(args.sessions, args.latency)))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,86 @@
+"""Load test for DocumentPool: render+preview throughput by worker count.
+
+Submits --jobs concurrent render_document jobs (fill, write, mammoth preview) for a
+synthetic template and reports jobs/s for each worker count, the longest event loop
+stall while they run, and how many jobs admission control turned away when the
+queue limit is lower than the load.
+
+    python -m benchmarks.document_pool --jobs 32 --paragraphs 1200
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_docx import make_template, placeholder_keys
+from document_pool import DocumentPool, DocumentPoolBusy, render_document
+
+
+async def loop_stall(stop: asyncio.Event) -> float:
+    """Longest delay of a 10 ms ticker, i.e. how long the event loop was blocked"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - start - 0.01)
+    return worst
+
+
+async def load(pool: DocumentPool, template_path: str, values, jobs: int, out_dir: str):
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_stall(stop))
+
+    async def job(n):
+        try:
+            await pool.run(render_document, template_path, values, os.path.join(out_dir, f"{n}.docx"))
+            return True
+        except DocumentPoolBusy:
+            return False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(job(n) for n in range(jobs)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, sum(results), await ticker
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=32)
+    parser.add_argument("--paragraphs", type=int, default=1200)
+    parser.add_argument("--placeholders", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="*", help="worker counts to try (default 1, 2, 4 .. cores)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({1, *[n for n in (2, 4, 8, 16) if n <= cores], cores})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template_path = os.path.join(tmp, "template.docx")
+        with open(template_path, "wb") as f:
+            f.write(make_template(paragraphs=args.paragraphs, placeholders=args.placeholders))
+        values = {key: f"value {key.lower()}" for key in placeholder_keys(args.placeholders)}
+
+        print(f"{args.jobs} jobs, {args.paragraphs} paragraphs, {cores} cores")
+        baseline = None
+        for workers in worker_counts:
+            pool = DocumentPool(workers=workers, queue_limit=args.jobs)
+            # Warm up every worker so process start and template parsing are not timed
+            asyncio.run(load(pool, template_path, values, workers * 2, tmp))
+            elapsed, done, stall = asyncio.run(load(pool, template_path, values, args.jobs, tmp))
+            pool.shutdown()
+
+            throughput = done / elapsed
+            baseline = baseline or throughput
+            print(f"workers={workers:2d}: {throughput:6.1f} jobs/s ({throughput / baseline:.2f}x), "
+                  f"max loop stall {stall * 1000:.0f} ms")
+
+        pool = DocumentPool(workers=worker_counts[0], queue_limit=max(args.jobs // 4, 1))
+        _, done, _ = asyncio.run(load(pool, template_path, values, args.jobs, tmp))
+        pool.shutdown()
+        print(f"queue_limit={pool.queue_limit}: {done} admitted, {pool.rejected} rejected with 503")
+
+
+if __name__ == "__main__":
+    main_cli()
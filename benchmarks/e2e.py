@@ -0,0 +1,257 @@
+"""End-to-end benchmark: upload -> chat -> generate -> update-values -> download.
+
+Builds a synthetic template (paragraphs, tables with merged cells, all five
+placeholder syntaxes), serves the app with uvicorn and drives its real endpoints
+from --concurrency simulated users against the fake LLM server. Reports per-endpoint
+p50/p95/p99, throughput and peak RSS, and writes them to a JSON file; --compare
+prints the change against an earlier result file.
+
+    python -m benchmarks.e2e --sessions 20 --concurrency 5 --latency 0.2 --output results.json
+    python -m benchmarks.e2e --output new.json --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.synthetic_docx import make_template
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def children_peak_rss_mb() -> float:
+    """Sum of the peak RSS of the live child processes (the document workers).
+
+    Read from /proc rather than RUSAGE_CHILDREN, which also counts the parent's pages
+    each child briefly shares between fork and exec.
+    """
+    total_kb = 0
+    for tid in os.listdir("/proc/self/task"):
+        with open(f"/proc/self/task/{tid}/children") as f:
+            for pid in f.read().split():
+                try:
+                    with open(f"/proc/{pid}/status") as status:
+                        for line in status:
+                            if line.startswith("VmHWM:"):
+                                total_kb += int(line.split()[1])
+                except FileNotFoundError:
+                    continue
+    return round(total_kb / 1024, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+class Recorder:
+    """Latency samples per endpoint"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, name: str, request):
+        start = time.perf_counter()
+        response = await request
+        self.samples[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            raise RuntimeError(f"{name}: {response.status_code} {response.text[:200]}")
+        return response
+
+    def summary(self):
+        return {
+            name: {
+                "count": len(values),
+                "errors": self.errors[name],
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "mean_ms": round(sum(values) / len(values) * 1000, 1)
+            }
+            for name, values in self.samples.items()
+        }
+
+
+async def user_session(client, recorder: Recorder, template: bytes, edits: int):
+    """One user filling a document from upload to download"""
+    files = {"file": ("template.docx", template)}
+    data = (await recorder.call("upload", client.post("/api/upload", files=files))).json()
+    session_id = data["session_id"]
+    placeholders = {}
+
+    while True:
+        placeholder = data["current_placeholder"]
+        answer = f"Value for {placeholder.lower()}"
+        placeholders[placeholder] = answer
+        data = (await recorder.call("chat", client.post(
+            "/api/chat", json={"session_id": session_id, "message": answer}
+        ))).json()
+        if data["type"] == "complete":
+            break
+        if data["type"] == "validation_error":
+            raise RuntimeError(f"answer for {placeholder} rejected: {data['message']}")
+
+    await recorder.call("generate", client.post(f"/api/generate?session_id={session_id}"))
+
+    for n, key in enumerate(list(placeholders)[:edits]):
+        await recorder.call("update_values", client.post(
+            f"/api/update-values?session_id={session_id}&incremental=true",
+            json={key: f"Edited value {n}"}
+        ))
+
+    await recorder.call("download", client.get(f"/api/download/{session_id}"))
+
+
+async def run(args, templates):
+    import httpx
+    import uvicorn
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=args.port + 1, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    recorder = Recorder()
+    failed = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(n):
+        nonlocal failed
+        async with semaphore:
+            try:
+                await user_session(client, recorder, templates[n % len(templates)], args.edits)
+            except Exception as e:
+                failed += 1
+                print(f"session {n} failed: {e}")
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port + 1}", timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+
+    server.should_exit = True
+    thread.join()
+    workers_rss = children_peak_rss_mb()
+    main.document_pool.shutdown(wait=True)
+    return recorder, elapsed, failed, workers_rss
+
+
+def compare(result: dict, path: str):
+    with open(path) as f:
+        previous = json.load(f)
+    print(f"\nvs {path} ({previous.get('label') or previous.get('commit')}):")
+    for name, stats in result["endpoints"].items():
+        before = previous["endpoints"].get(name)
+        if not before:
+            continue
+        deltas = "  ".join(
+            f"{key} {(stats[key] - before[key]) / before[key] * 100:+6.1f}%"
+            for key in ("p50_ms", "p95_ms", "p99_ms") if before[key]
+        )
+        print(f"  {name:14s} {deltas}")
+    before, after = previous["throughput"]["sessions_per_second"], result["throughput"]["sessions_per_second"]
+    if before:
+        print(f"  {'throughput':14s} {(after - before) / before * 100:+6.1f}%")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="users that go through the whole flow")
+    parser.add_argument("--concurrency", type=int, default=5, help="users active at the same time")
+    parser.add_argument("--paragraphs", type=int, default=200)
+    parser.add_argument("--tables", type=int, default=4)
+    parser.add_argument("--table-rows", type=int, default=4)
+    parser.add_argument("--table-cols", type=int, default=3)
+    parser.add_argument("--merged-cells", type=int, default=1, help="merged rows per table")
+    parser.add_argument("--placeholders", type=int, default=15, help="distinct placeholders")
+    parser.add_argument("--density", type=float, default=0.2, help="placeholder occurrences per paragraph")
+    parser.add_argument("--distinct-templates", action="store_true",
+                        help="give every user a different template instead of one shared template")
+    parser.add_argument("--edits", type=int, default=3, help="update-values calls per user")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency in seconds")
+    parser.add_argument("--port", type=int, default=8775)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    template_options = dict(
+        paragraphs=args.paragraphs, placeholders=args.placeholders, density=args.density,
+        tables=args.tables, table_rows=args.table_rows, table_cols=args.table_cols,
+        merged_cells=args.merged_cells
+    )
+    count = args.sessions if args.distinct_templates else 1
+    templates = [make_template(seed=n, **template_options) for n in range(count)]
+
+    with FakeLLMServer(latency=args.latency, port=args.port) as llm:
+        os.environ["OPENAI_BASE_URL"] = llm.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        recorder, elapsed, failed, workers_rss = asyncio.run(run(args, templates))
+        llm_calls = llm.calls
+
+    requests = sum(len(values) for values in recorder.samples.values())
+    result = {
+        "label": args.label,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {**vars(args), "template_bytes": len(templates[0])},
+        "endpoints": recorder.summary(),
+        "throughput": {
+            "elapsed_seconds": round(elapsed, 2),
+            "sessions_completed": args.sessions - failed,
+            "sessions_failed": failed,
+            "sessions_per_second": round((args.sessions - failed) / elapsed, 3),
+            "requests_per_second": round(requests / elapsed, 1)
+        },
+        "peak_rss_mb": {
+            "app": peak_rss_mb(),
+            "document_workers": workers_rss
+        },
+        "llm_calls": llm_calls
+    }
+
+    print(f"{args.sessions} sessions, {args.concurrency} concurrent, template {len(templates[0]) // 1024} KB, "
+          f"LLM latency {args.latency}s")
+    for name, stats in result["endpoints"].items():
+        print(f"  {name:14s} n={stats['count']:5d}  p50 {stats['p50_ms']:8.1f}  p95 {stats['p95_ms']:8.1f}  "
+              f"p99 {stats['p99_ms']:8.1f} ms")
+    print(f"  throughput     {result['throughput']['sessions_per_second']} sessions/s, "
+          f"{result['throughput']['requests_per_second']} requests/s, {failed} failed")
+    print(f"  peak RSS       app {result['peak_rss_mb']['app']} MB, "
+          f"document workers {result['peak_rss_mb']['document_workers']} MB")
+    print(f"  LLM calls      {llm_calls}")
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,168 @@
+"""Local fake OpenAI-compatible chat completions server for benchmarks.
+
+Every request sleeps for a configurable latency and then returns a canned
+answer, so the app can be driven end to end without a real API key. With a
+token_delay the answer also takes that long per word to generate; streamed
+requests (stream=true) receive each word as soon as it is "generated". A
+failure_rate makes that fraction of requests fail with a 429 rate-limit error.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_fake_llm_app(latency: float = 0.5, token_delay: float = 0.0, failure_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    app.state.latency = latency
+    app.state.token_delay = token_delay
+    app.state.failure_rate = failure_rate
+    app.state.calls = 0
+    app.state.failures = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        await asyncio.sleep(app.state.latency)
+
+        if random.random() < app.state.failure_rate:
+            app.state.failures += 1
+            return JSONResponse(status_code=429, content={"error": {
+                "message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"
+            }})
+
+        system_prompt = body["messages"][0]["content"]
+        user_prompt = body["messages"][-1]["content"]
+        if body.get("response_format", {}).get("type") == "json_schema":
+            content = fake_structured_reply(user_prompt, body["response_format"]["json_schema"].get("name", ""))
+        else:
+            content = fake_reply(system_prompt, user_prompt)
+
+        tokens = re.findall(r"\S+\s*", content)
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(app, body, tokens), media_type="text/event-stream")
+        await asyncio.sleep(app.state.token_delay * len(tokens))
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(system_prompt + user_prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": len(system_prompt + user_prompt + content) // 4
+            }
+        }
+
+    return app
+
+
+async def stream_chunks(app: FastAPI, body: dict, tokens: list):
+    """Chat completion chunks in the OpenAI server-sent event format, one per word"""
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        data = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(data)}\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    for token in tokens:
+        yield chunk({"content": token})
+        await asyncio.sleep(app.state.token_delay)
+    yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+def fake_reply(system_prompt: str, user_prompt: str) -> str:
+    """Canned reply matching what the calling node expects"""
+    if "validation" in system_prompt.lower():
+        answer = ""
+        for line in user_prompt.splitlines():
+            if line.strip().startswith("User response:"):
+                answer = line.split(":", 1)[1].strip()
+        return json.dumps({"valid": True, "formatted_value": answer, "feedback": "Looks good"})
+
+    placeholder = "this field"
+    for line in user_prompt.splitlines():
+        if line.strip().startswith("Placeholder:"):
+            placeholder = line.split(":", 1)[1].strip()
+    return f"What value should be used for {placeholder}?"
+
+
+def fake_structured_reply(user_prompt: str, schema: str = "") -> str:
+    """Canned reply for the batch question generation and batch validation calls"""
+    lines = [line.strip() for line in user_prompt.splitlines()]
+    if schema == "ValidatedAnswers":
+        results = []
+        for line, next_line in zip(lines, lines[1:]):
+            if line.startswith("- Placeholder:") and next_line.startswith("User response:"):
+                answer = json.loads(next_line.split(":", 1)[1])
+                results.append({
+                    "placeholder": line.split(":", 1)[1].strip(),
+                    "valid": bool(answer.strip()),
+                    "formatted_value": answer.strip(),
+                    "feedback": "Looks good" if answer.strip() else "Please provide a value"
+                })
+        return json.dumps({"results": results})
+
+    questions = []
+    for line in lines:
+        if line.startswith("- Placeholder:"):
+            # "- Placeholder: KEY (excerpts 1, 2)"
+            placeholder = re.sub(r" \(excerpts [^)]*\)$", "", line.split(":", 1)[1].strip())
+            questions.append({
+                "placeholder": placeholder,
+                "question": f"What value should be used for {placeholder}?"
+            })
+    return json.dumps({"questions": questions})
+
+
+class FakeLLMServer:
+    """Runs the fake LLM app with uvicorn in a background thread"""
+
+    def __init__(self, latency: float = 0.5, port: int = 8765, token_delay: float = 0.0,
+                 failure_rate: float = 0.0):
+        self.app = create_fake_llm_app(latency, token_delay, failure_rate)
+        self.port = port
+        self.server = uvicorn.Server(
+            uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning")
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def calls(self) -> int:
+        return self.app.state.calls
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
@@ -0,0 +1,81 @@
+"""Validating a whole form: one /api/chat request per field vs one /api/answers request.
+
+Uploads a synthetic template with --fields placeholders and validates an answer for
+every field, once through /api/chat and once through /api/answers, against the fake
+LLM server with the local validator off, so every answer needs the LLM.
+
+    python -m benchmarks.form_validation --fields 40 --sessions 3 --latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.synthetic_docx import make_template
+
+
+async def upload(client, main, template: bytes):
+    response = await client.post("/api/upload", files={"file": ("form.docx", template)})
+    session_id = response.json()["session_id"]
+    return session_id, main.session_store.get(session_id)["workflow_state"]["placeholders"]
+
+
+async def chat_session(client, main, template: bytes) -> float:
+    session_id, placeholders = await upload(client, main, template)
+    start = time.perf_counter()
+    for placeholder in placeholders:
+        response = await client.post("/api/chat", json={"session_id": session_id, "message": f"value of {placeholder}"})
+        response.raise_for_status()
+    assert response.json()["type"] == "complete", response.json()
+    return time.perf_counter() - start
+
+
+async def answers_session(client, main, template: bytes) -> float:
+    session_id, placeholders = await upload(client, main, template)
+    start = time.perf_counter()
+    response = await client.post("/api/answers", json={
+        "session_id": session_id, "answers": {p: f"value of {p}" for p in placeholders}
+    })
+    response.raise_for_status()
+    assert response.json()["type"] == "complete", response.json()
+    return time.perf_counter() - start
+
+
+async def run(server: FakeLLMServer, fields: int, sessions: int):
+    import httpx
+    import main
+    import langgraph_agents
+
+    langgraph_agents.LOCAL_VALIDATION = False
+    template = make_template(paragraphs=fields * 2, placeholders=fields)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+        for label, session in (("/api/chat   ", chat_session), ("/api/answers", answers_session)):
+            durations = []
+            calls = 0
+            for _ in range(sessions):
+                before = server.calls
+                durations.append(await session(client, main, template))
+                calls += server.calls - before
+            print(f"{label}: {statistics.median(durations) * 1000:8.1f} ms per form (p50 of {sessions}), "
+                  f"{calls / sessions:.1f} LLM calls per session incl. upload")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with FakeLLMServer(latency=args.latency, port=args.port) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        asyncio.run(run(server, args.fields, args.sessions))
+
+
+if __name__ == "__main__":
+    main_cli()
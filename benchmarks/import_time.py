@@ -0,0 +1,64 @@
+"""Import-time budget for the API process.
+
+Imports main in a fresh interpreter with `python -X importtime` and fails (exit code 1)
+when the import takes longer than --budget-ms, or when it loads a module that should
+only be imported on first use (the LLM stack in the API process, the document
+libraries in the document workers). Prints the slowest top-level imports either way.
+
+    python -m benchmarks.import_time --budget-ms 800 --runs 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Loaded on first use, never by `import main`
+LAZY_MODULES = ("langgraph", "langchain_core", "langchain_openai", "openai", "docx", "mammoth")
+
+
+def measure():
+    """Cumulative import time of main in microseconds, and the self-reported import tree"""
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-fake")}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True, env=env, check=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(cumulative_us), depth))
+    total = next(us for name, us, _ in imports if name == "main")
+    return total, imports
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=800)
+    parser.add_argument("--runs", type=int, default=3, help="the best run counts, to ignore a cold disk cache")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    total, imports = min(runs, key=lambda run: run[0])
+
+    print(f"import main: {total / 1000:.0f} ms (best of {args.runs}, budget {args.budget_ms:g} ms)")
+    children = sorted((i for i in imports if i[2] == 1), key=lambda i: -i[1])
+    for name, us, _ in children[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    loaded = sorted({name for name, _, _ in imports if name.split(".")[0] in LAZY_MODULES})
+    failed = False
+    if loaded:
+        print(f"FAIL: imported at startup: {', '.join(sorted({n.split('.')[0] for n in loaded}))}")
+        failed = True
+    if total / 1000 > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:g} ms budget")
+        failed = True
+    if not failed:
+        print("PASS")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_cli()
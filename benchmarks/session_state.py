@@ -0,0 +1,143 @@
+"""Per-turn session state overhead and bytes per session.
+
+Builds the workflow state of a session with --placeholders placeholders (context
+snippets, questions, answers) and times one chat turn's state handling: restore the
+session, apply a validation and the next question, snapshot it again. Compares the
+previous handling (compressed JSON, full-dict copies and an AIMessage per update)
+with the versioned msgpack snapshot and in-place node updates, halfway through the
+conversation. The snapshot's static segment is stored once per template, like the
+session stores do, and reported separately. "cold" clears the static segment cache
+before every turn, like the first turn of a template after a restart.
+
+    python -m benchmarks.session_state --placeholders 40 --turns 2000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import zlib
+
+WORDS = ("the company shall issue to the investor shares of preferred stock at the valuation cap "
+         "subject to the discount rate on the date of the equity financing as set forth herein").split()
+
+
+def make_session(placeholders: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    keys = [f"{rng.choice(['COMPANY', 'INVESTOR', 'PURCHASE', 'STATE'])}_{rng.choice(['NAME', 'AMOUNT', 'DATE'])}_{i}"
+            for i in range(placeholders)]
+    answered = placeholders // 2
+    return {
+        "file_path": f"uploads/templates/{'0' * 64}.docx",
+        "original_filename": "safe.docx",
+        "workflow_state": {
+            "placeholders": keys,
+            "current_placeholder": keys[answered],
+            "current_index": answered,
+            "collected_values": {k: f"value {i}" for i, k in enumerate(keys[:answered])},
+            "user_response": "",
+            "question": f"What value should be used for {keys[answered]}?",
+            "validation_result": {"valid": True, "formatted_value": "value", "feedback": "Looks good"},
+            "questions": {k: f"What value should be used for {k}?" for k in keys},
+            # About PROMPT_SNIPPET_TOKENS (120) tokens of context per placeholder
+            "contexts": {k: " ".join(rng.choice(WORDS) for _ in range(90)) + f" [{k}]" for k in keys},
+            "placeholder_groups": {}
+        }
+    }
+
+
+def legacy_serialize(session: dict) -> bytes:
+    data = dict(session)
+    data["workflow_state"] = {k: v for k, v in session["workflow_state"].items() if k != "messages"}
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+
+
+def legacy_deserialize(blob: bytes) -> dict:
+    session = json.loads(zlib.decompress(blob))
+    session["workflow_state"]["messages"] = []
+    return session
+
+
+def legacy_turn(blob: bytes, answer: str) -> bytes:
+    from langchain_core.messages import AIMessage
+    session = legacy_deserialize(blob)
+    state = {**session["workflow_state"], "user_response": answer}
+    values = state["collected_values"].copy()
+    values[state["current_placeholder"]] = answer
+    state = {**state, "collected_values": values, "current_index": state["current_index"] + 1,
+             "validation_result": {"valid": True, "formatted_value": answer, "feedback": "Looks good"},
+             "messages": [AIMessage(content="Looks good")]}
+    question = state["questions"][state["placeholders"][state["current_index"]]]
+    state = {**state, "question": question, "current_placeholder": state["placeholders"][state["current_index"]],
+             "messages": [AIMessage(content=question)]}
+    session["workflow_state"] = state
+    return legacy_serialize(session)
+
+
+# Static segments by digest, as a session store keeps them
+segments = {}
+
+
+def snapshot_serialize(session: dict) -> bytes:
+    from session_store import serialize_session
+    blob, digest, segment = serialize_session(session)
+    if digest is not None:
+        segments.setdefault(digest, segment)
+    return blob
+
+
+def snapshot_turn(blob: bytes, answer: str) -> bytes:
+    from langgraph_agents import _question_update, _validation_update
+    from session_store import deserialize_session
+    session = deserialize_session(blob, segments.get)
+    state = session["workflow_state"]
+    state["user_response"] = answer
+    _validation_update(state, {"valid": True, "formatted_value": answer, "feedback": "Looks good"})
+    _question_update(state, state["questions"][state["placeholders"][state["current_index"]]])
+    return snapshot_serialize(session)
+
+
+def time_turns(turn, blob: bytes, turns: int, cold: bool = False) -> float:
+    """Median microseconds per turn, always from the same mid-conversation snapshot"""
+    from session_store import segment_cache
+    durations = []
+    for i in range(turns):
+        if cold:
+            segment_cache.encoded.clear()
+            segment_cache.decoded.clear()
+        start = time.perf_counter()
+        turn(blob, f"answer {i}")
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1e6
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--placeholders", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    from session_store import deserialize_session
+
+    session = make_session(args.placeholders)
+    legacy_blob = legacy_serialize(session)
+    snapshot_blob = snapshot_serialize(session)
+    restored = deserialize_session(snapshot_blob, segments.get)
+    assert restored == session, "snapshot does not restore the same session"
+
+    # Warm up imports and caches
+    legacy_turn(legacy_blob, "warm up")
+    snapshot_turn(snapshot_blob, "warm up")
+
+    legacy_us = time_turns(legacy_turn, legacy_blob, args.turns)
+    snapshot_us = time_turns(snapshot_turn, snapshot_blob, args.turns)
+    cold_us = time_turns(snapshot_turn, snapshot_blob, args.turns, cold=True)
+    print(f"{args.placeholders} placeholders, {len(json.dumps(session))} bytes of state as JSON")
+    print(f"  legacy   (JSON + zlib, copies)     {len(legacy_blob):7d} bytes/session  {legacy_us:8.1f} us/turn")
+    print(f"  snapshot (msgpack v2, in place)    {len(snapshot_blob):7d} bytes/session  {snapshot_us:8.1f} us/turn"
+          f"  ({cold_us:.1f} us cold)")
+    print(f"  + static segment, once per template {sum(map(len, segments.values())):6d} bytes")
+
+
+if __name__ == "__main__":
+    main_cli()
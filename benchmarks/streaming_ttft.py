@@ -0,0 +1,109 @@
+"""Time to first question token: streaming endpoints against the JSON ones.
+
+Runs the fake LLM with a per-word generation delay and every question generated at
+request time (incremental mode, no prefetch, no question cache). For /api/upload and
+/api/chat it reports the full response time, and for their /stream variants the time
+to the first token event and to the final event.
+
+    python -m benchmarks.streaming_ttft --runs 5 --latency 0.3 --token-delay 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+
+from benchmarks.concurrent_chat import make_template
+from benchmarks.fake_llm import FakeLLMServer
+
+ANSWER = "Acme, Inc."
+
+
+async def timed_stream(client, url, **kwargs):
+    """Seconds to the first token event and to the final event, and the final event's data"""
+    start = time.perf_counter()
+    first_token = None
+    async with client.stream("POST", url, **kwargs) as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "token":
+                    first_token = first_token or time.perf_counter() - start
+                else:
+                    return first_token, time.perf_counter() - start, json.loads(line[len("data: "):])
+    raise RuntimeError(f"{url} ended without a final event")
+
+
+async def run(runs: int, port: int):
+    import httpx
+    import uvicorn
+    import main
+
+    # A real server: the in-process ASGI transport would buffer the streamed responses
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    template = make_template()
+    timings = {name: [] for name in ("upload", "upload_stream_first", "upload_stream_done",
+                                     "chat", "chat_stream_first", "chat_stream_done")}
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+        for _ in range(runs):
+            start = time.perf_counter()
+            response = await client.post("/api/upload", files={"file": ("template.docx", template)})
+            response.raise_for_status()
+            timings["upload"].append(time.perf_counter() - start)
+            session_id = response.json()["session_id"]
+
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={"session_id": session_id, "message": ANSWER})
+            response.raise_for_status()
+            timings["chat"].append(time.perf_counter() - start)
+
+            first, done, data = await timed_stream(
+                client, "/api/upload/stream", files={"file": ("template.docx", template)}
+            )
+            timings["upload_stream_first"].append(first)
+            timings["upload_stream_done"].append(done)
+
+            first, done, _ = await timed_stream(
+                client, "/api/chat/stream", json={"session_id": data["session_id"], "message": ANSWER}
+            )
+            timings["chat_stream_first"].append(first)
+            timings["chat_stream_done"].append(done)
+
+    server.should_exit = True
+    thread.join()
+
+    for name, values in timings.items():
+        print(f"{name:20s} p50 {statistics.median(values) * 1000:7.0f} ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds to the first token")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="seconds per generated word")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    with FakeLLMServer(latency=args.latency, port=args.port, token_delay=args.token_delay) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        # Generate every question while the request waits, so both variants pay for it
+        os.environ["QUESTION_MODE"] = "incremental"
+        os.environ["PREFETCH_MAX_IN_FLIGHT"] = "0"
+        os.environ["QUESTION_CACHE_SIZE"] = "0"
+        asyncio.run(run(args.runs, args.port + 1))
+
+
+if __name__ == "__main__":
+    main_cli()
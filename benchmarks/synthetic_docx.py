@@ -0,0 +1,91 @@
+"""Synthetic .docx templates of configurable size for benchmarks."""
+import io
+import random
+
+from docx import Document
+
+FILLER = ("The parties agree that the terms of this agreement shall be binding upon their "
+          "successors and assigns and that no amendment shall be effective unless in writing").split()
+
+PLACEHOLDER_FORMS = [
+    "{{{{{key}}}}}",   # {{key}}
+    "${{{key}}}",      # ${key}
+    "{{{key}}}",       # {key}
+    "[{key}]",         # [key]
+    "___{key}___",     # ___KEY___
+]
+
+
+def placeholder_keys(count: int):
+    """FIELD_AAAA, FIELD_AAAB, ...: letters only, so the ___KEY___ form is a placeholder too"""
+    keys = []
+    for i in range(count):
+        letters = ""
+        for _ in range(4):
+            i, digit = divmod(i, 26)
+            letters = chr(ord("A") + digit) + letters
+        keys.append(f"FIELD_{letters}")
+    return keys
+
+
+def make_template(paragraphs: int = 100, placeholders: int = 20, words_per_paragraph: int = 40,
+                  split_runs: float = 0.2, seed: int = 0, tables: int = 0, table_rows: int = 4,
+                  table_cols: int = 3, merged_cells: int = 0, density: float = None) -> bytes:
+    """Build a template and return its bytes.
+
+    Placeholders cycle through every syntax detect_placeholders supports and are
+    spread evenly over the paragraphs; a split_runs fraction of them is cut across
+    two runs, the second one bold, like Word often does. density is the number of
+    placeholder occurrences per paragraph, e.g. 0.25 for one every 4 paragraphs
+    (default: enough for every key to appear about twice).
+
+    With tables, every table cell holds a placeholder and merged_cells rows of each
+    table get two cells merged, which python-docx reports as repeated cells.
+    """
+    rng = random.Random(seed)
+    keys = placeholder_keys(placeholders)
+    doc = Document()
+    slot = 0
+
+    def add_placeholder(para):
+        nonlocal slot
+        key = keys[slot % len(keys)]
+        form = PLACEHOLDER_FORMS[slot % len(PLACEHOLDER_FORMS)].format(key=key)
+        slot += 1
+        if rng.random() < split_runs:
+            middle = len(form) // 2
+            para.add_run(form[:middle])
+            para.add_run(form[middle:] + " ").bold = True
+        else:
+            para.add_run(form + " ")
+
+    if density is None:
+        density = max(1, -(-placeholders * 2 // max(paragraphs, 1)))
+    owed = 0.0
+    table_every = max(1, paragraphs // tables) if tables else 0
+
+    for p in range(paragraphs):
+        para = doc.add_paragraph()
+        words = [rng.choice(FILLER) for _ in range(words_per_paragraph)]
+        text = " ".join(words) + " "
+        para.add_run(text)
+
+        owed += density
+        while owed >= 1:
+            add_placeholder(para)
+            owed -= 1
+
+        if table_every and (p + 1) % table_every == 0 and len(doc.tables) < tables:
+            table = doc.add_table(rows=table_rows, cols=table_cols)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.paragraphs[0].add_run(rng.choice(FILLER) + " ")
+                    add_placeholder(cell.paragraphs[0])
+            if table_cols > 1:
+                for row in rng.sample(range(table_rows), min(merged_cells, table_rows)):
+                    col = rng.randrange(table_cols - 1)
+                    table.cell(row, col).merge(table.cell(row, col + 1))
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
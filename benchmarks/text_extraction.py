@@ -0,0 +1,73 @@
+"""Text extraction: streaming reader vs the python-docx object model.
+
+Builds a large synthetic template (long body and big tables with merged cells) and,
+in a fresh process per mode so peak RSS is not shared, indexes its placeholders with
+TEXT_EXTRACTION=stream and =docx. Reports time, peak RSS and the text nodes found.
+
+    python -m benchmarks.text_extraction --paragraphs 20000 --tables 20 --table-rows 500
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic_docx import make_template
+
+
+def measure(path: str, mode: str) -> dict:
+    """Runs in the child process"""
+    from document_processor import DocumentProcessor
+
+    start = time.perf_counter()
+    processor = DocumentProcessor(path, extraction=mode)
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "nodes": processor.index.node_count,
+        "placeholders": len(processor.index.placeholders())
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=20000)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--table-rows", type=int, default=500)
+    parser.add_argument("--table-cols", type=int, default=4)
+    parser.add_argument("--merged-cells", type=int, default=50, help="merged rows per table")
+    parser.add_argument("--placeholders", type=int, default=200)
+    parser.add_argument("--measure", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    template = make_template(
+        paragraphs=args.paragraphs, placeholders=args.placeholders, tables=args.tables,
+        table_rows=args.table_rows, table_cols=args.table_cols, merged_cells=args.merged_cells
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "large.docx")
+        with open(path, "wb") as f:
+            f.write(template)
+        print(f"template: {len(template) / 1024 / 1024:.1f} MB zipped, {args.paragraphs} paragraphs, "
+              f"{args.tables} tables of {args.table_rows}x{args.table_cols}")
+        for mode in ("stream", "docx"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.text_extraction", "--measure", path, mode],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            print(f"  {mode:6s} {result['seconds']:6.2f}s  peak RSS {result['peak_rss_mb']:7.1f} MB  "
+                  f"{result['nodes']} nodes, {result['placeholders']} placeholders")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,100 @@
+"""Measure /api/chat latency with and without the local fast-path validator.
+
+Walks sessions of a SAFE-like template through /api/chat with realistic answers,
+once with LOCAL_VALIDATION on and once off, against the fake LLM server.
+
+    python -m benchmarks.validation_fast_path --sessions 5 --latency 0.3
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import time
+
+from docx import Document
+
+from benchmarks.fake_llm import FakeLLMServer
+
+ANSWERS = {
+    "Company Name": "Acme, Inc.",
+    "Investor Name": "Jane Doe",
+    "Purchase Amount": "$500,000",
+    "Valuation Cap": "10M",
+    "Discount Rate": "20%",
+    "Effective Date": "March 3, 2026",
+    "Investor Email": "jane@example.com",
+    "Company Address": "100 Market Street, San Francisco, CA",
+    "State of Incorporation": "Delaware",
+    "Title": "chief executive officer",
+}
+
+
+def make_template() -> bytes:
+    doc = Document()
+    doc.add_paragraph("THIS SAFE is issued by [Company Name], a [State of Incorporation] corporation, "
+                      "located at [Company Address], on [Effective Date].")
+    doc.add_paragraph("In exchange for $[Purchase Amount] paid by [Investor Name] ([Investor Email]), "
+                      "the Company issues the right to shares at a [Valuation Cap] cap "
+                      "and a [Discount Rate] discount.")
+    doc.add_paragraph("Signed by its [Title].")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+async def run_sessions(client, sessions: int):
+    latencies = []
+    template = make_template()
+    for _ in range(sessions):
+        response = await client.post("/api/upload", files={"file": ("safe.docx", template)})
+        data = response.json()
+        session_id, placeholder = data["session_id"], data["current_placeholder"]
+
+        while True:
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={
+                "session_id": session_id, "message": ANSWERS[placeholder]
+            })
+            latencies.append(time.perf_counter() - start)
+            data = response.json()
+            if data["type"] == "complete":
+                break
+            placeholder = data["current_placeholder"]
+    return latencies
+
+
+async def run(sessions: int):
+    import httpx
+    import main
+    import langgraph_agents
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+        for enabled in (False, True):
+            langgraph_agents.LOCAL_VALIDATION = enabled
+            latencies = await run_sessions(client, sessions)
+            p50 = statistics.median(latencies)
+            label = "local fast path" if enabled else "LLM only       "
+            print(f"{label}: /api/chat p50 {p50 * 1000:7.1f} ms over {len(latencies)} answers")
+
+    stats = langgraph_agents.local_validator.stats()
+    print(f"LLM avoidance rate: {stats['llm_avoidance_rate']:.0%} "
+          f"({stats['answered_locally']}/{stats['attempts']} answered locally)")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with FakeLLMServer(latency=args.latency, port=args.port) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+        asyncio.run(run(args.sessions))
+
+
+if __name__ == "__main__":
+    main_cli()
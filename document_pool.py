@@ -0,0 +1,184 @@
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+from metrics import METRICS_ENABLED, collect_spans, record_span, span
+
+DOCUMENT_WORKERS = int(os.getenv("DOCUMENT_WORKERS", str(os.cpu_count() or 1)))
+DOCUMENT_QUEUE_LIMIT = int(os.getenv("DOCUMENT_QUEUE_LIMIT", str(max(DOCUMENT_WORKERS, 1) * 4)))
+DOCUMENT_RETRY_AFTER = int(os.getenv("DOCUMENT_RETRY_AFTER", "2"))
+WORKER_TEMPLATE_CACHE = int(os.getenv("WORKER_TEMPLATE_CACHE", "16"))
+
+# Only the workers parse documents, so the API process never imports python-docx or mammoth
+if TYPE_CHECKING:
+    from document_processor import DocumentProcessor
+
+# Parsed templates kept inside each worker process. Templates are stored under their
+# content hash, so a path always means the same bytes and jobs only send the path.
+_processors: "OrderedDict[str, DocumentProcessor]" = OrderedDict()
+
+def worker_processor(file_path: str) -> "DocumentProcessor":
+    processor = _processors.get(file_path)
+    if processor is None:
+        from document_processor import DocumentProcessor
+        processor = DocumentProcessor(file_path)
+    _processors[file_path] = processor
+    _processors.move_to_end(file_path)
+    while len(_processors) > WORKER_TEMPLATE_CACHE:
+        _processors.popitem(last=False)
+    return processor
+
+# Jobs run in the worker processes. They take paths and values and return plain data,
+# so parsed documents never cross the process boundary.
+
+class TemplateParseError(ValueError):
+    """Raised by analyze_template when the file is not a readable .docx"""
+
+def analyze_template(file_path: str) -> Dict:
+    """Parse a template: placeholders and the token-budgeted context snippet of each.
+    The document text itself stays in the worker.
+
+    Variants of one placeholder ({Company Name}, [COMPANY_NAME], ...) are grouped:
+    placeholders lists one canonical key per group and groups maps each canonical key
+    with more than one variant to all its variants.
+    """
+    from placeholder_groups import group_placeholders
+    from prompt_builder import build_snippets
+    try:
+        processor = worker_processor(file_path)
+    except Exception as e:
+        raise TemplateParseError(f"Could not parse {file_path}: {e!r}") from None
+    detected = processor.detect_placeholders()
+    counts = {p: len(processor.index.occurrences[p]) for p in detected}
+    groups = group_placeholders(detected, counts)
+    placeholders = list(groups)
+    with span("build_snippets"):
+        contexts = build_snippets(processor.index, placeholders, groups)
+    return {
+        "placeholders": placeholders,
+        "groups": {key: variants for key, variants in groups.items() if len(variants) > 1},
+        "contexts": contexts
+    }
+
+def render_document(file_path: str, values: Dict[str, str], output_path: Optional[str],
+                    changed_keys: Optional[List[str]] = None):
+    """Write the filled document to output_path (unless None, when it is already
+    stored) and return its preview.
+
+    Returns the full preview HTML, or with changed_keys the patch of affected blocks.
+    """
+    processor = worker_processor(file_path)
+    if output_path is not None:
+        with open(output_path, "wb") as f:
+            f.write(processor.render(values))
+    if changed_keys is None:
+        return processor.preview(values)
+    return processor.preview_patch(values, changed_keys)
+
+def fill_document(file_path: str, values: Dict[str, str]) -> bytes:
+    """Filled document as .docx bytes, for callers that package the result themselves"""
+    return worker_processor(file_path).render(values)
+
+def warm_up() -> int:
+    """Load the document libraries (and the token encoding) in a worker ahead of the first real job"""
+    import document_processor
+    from prompt_builder import count_tokens
+    count_tokens("")
+    return os.getpid()
+
+def run_job(job: Callable, *args):
+    """Run a job and return its result with the timing spans it recorded in the worker"""
+    with collect_spans() as spans:
+        return job(*args), spans
+
+class DocumentPoolBusy(Exception):
+    """Raised when the pool already has queue_limit jobs queued or running"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Document workers are busy")
+        self.retry_after = retry_after
+
+class DocumentPool:
+    """Runs CPU-bound document jobs (parsing, filling, mammoth) off the event loop.
+
+    With workers > 0 jobs go to a process pool, otherwise to a single background
+    thread. At most queue_limit jobs are admitted at once; run() raises
+    DocumentPoolBusy beyond that so the API can answer 503 instead of queueing
+    without bound.
+    """
+
+    def __init__(self, workers: int = DOCUMENT_WORKERS, queue_limit: int = DOCUMENT_QUEUE_LIMIT,
+                 retry_after: int = DOCUMENT_RETRY_AFTER):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.retry_after = retry_after
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.broken = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn: forking a process that already runs threads (uvicorn, SQLite) is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    async def run(self, job: Callable, *args):
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise DocumentPoolBusy(self.retry_after)
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if not METRICS_ENABLED:
+                result = await loop.run_in_executor(self.executor, job, *args)
+            else:
+                # Round trip including queueing, next to the worker-side stages it contains
+                with span(f"pool_{job.__name__}"):
+                    result, spans = await loop.run_in_executor(self.executor, run_job, job, *args)
+                # Recorded here so they land in this process's metrics and carry the session id
+                for stage, seconds, attributes in spans:
+                    record_span(stage, seconds, attributes)
+            self.completed += 1
+            return result
+        except BrokenExecutor:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next job
+            self._executor = None
+            self.broken += 1
+            raise
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+    async def warm_up(self):
+        """Start the workers and load the document libraries in them"""
+        pids = await asyncio.gather(*(self.run(warm_up) for _ in range(max(self.workers, 1))))
+        print(f"Document workers warmed up: {len(set(pids))} process(es)")
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "broken": self.broken,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -1,166 +1,496 @@
+import hashlib
+import io
+import os
 import re
+import zipfile
+from bisect import bisect_right
+from collections import OrderedDict
+from xml.sax.saxutils import escape
 from docx import Document
-from typing import List, Dict
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import qn
+from lxml import etree
+from typing import Callable, Iterable, List, Dict, NamedTuple, Tuple
 import mammoth
+from metrics import span
+from docx_text import iter_text_nodes, text_parts
 
-class DocumentProcessor:
+COMPILED_TEMPLATE_CACHE_SIZE = int(os.getenv("COMPILED_TEMPLATE_CACHE_SIZE", "32"))
+# "stream" reads the text straight from the zip (all parts, bounded memory),
+# "docx" from the python-docx object model (body paragraphs and tables only)
+TEXT_EXTRACTION = os.getenv("TEXT_EXTRACTION", "stream")
+
+# All supported placeholder syntaxes in one pattern. Longer delimiters come first so
+# {{x}}, ${x} and $[x] are not also reported as {x} or [x].
+PLACEHOLDER_PATTERN = re.compile(
+    r'\{\{(?P<double_brace>[^{}]+)\}\}'      # {{placeholder}}
+    r'|\$\{(?P<dollar_brace>[^{}]+)\}'        # ${placeholder}
+    r'|\$\[(?P<dollar_bracket>[^\[\]]+)\]'     # $[placeholder], the $ is replaced too
+    r'|\{(?P<brace>[^{}]+)\}'                 # {placeholder}
+    r'|\[(?P<bracket>[^\[\]]+)\]'             # [PLACEHOLDER]
+    r'|_{2,}(?P<underscore>[A-Z](?:[A-Z_ ]*?[A-Z])?)_{2,}'  # ___PLACEHOLDER___
+)
+
+# Visible text of a paragraph, including hyperlinks and tracked insertions
+PARAGRAPH_TEXT_XPATH = './w:r/w:t | ./w:hyperlink/w:r/w:t | ./w:ins/w:r/w:t'
+
+def _splice_placeholders(p, replacement: Callable) -> bool:
+    """Replace placeholders in a w:p element in one regex pass over its visible text.
+    
+    Matching runs on the concatenated text of all runs, so placeholders split across
+    runs are found. replacement(match) is called in document order and returns the new
+    text, or None to leave the placeholder alone. The new text goes into the run where
+    the placeholder starts and the rest is cut from the following runs, so all other
+    run formatting (bold, italic, fonts) is kept. Returns True if anything was replaced.
+    """
+    elements = p.xpath(PARAGRAPH_TEXT_XPATH)
+    if not elements:
+        return False
+    
+    texts = [e.text or "" for e in elements]
+    full_text = "".join(texts)
+    splices = []
+    for match in PLACEHOLDER_PATTERN.finditer(full_text):
+        new_text = replacement(match)
+        if new_text is not None:
+            splices.append((match, new_text))
+    if not splices:
+        return False
+    
+    starts = []
+    position = 0
+    for text in texts:
+        starts.append(position)
+        position += len(text)
+    
+    changed = set()
+    # From the end so offsets of earlier matches stay valid
+    for match, new_text in reversed(splices):
+        first = bisect_right(starts, match.start()) - 1
+        last = bisect_right(starts, match.end() - 1) - 1
+        head = texts[first][:match.start() - starts[first]]
+        tail = texts[last][match.end() - starts[last]:]
+        
+        if first == last:
+            texts[first] = head + new_text + tail
+        else:
+            texts[first] = head + new_text
+            for i in range(first + 1, last):
+                texts[i] = ""
+            texts[last] = tail
+        changed.update(range(first, last + 1))
+    
+    for i in changed:
+        elements[i].text = texts[i]
+        elements[i].set(qn('xml:space'), 'preserve')
+    return True
+
+def substitute_paragraph(paragraph, values: Dict[str, str]) -> bool:
+    """Replace every placeholder of the paragraph that has a value, keeping run formatting"""
+    return _splice_placeholders(
+        paragraph._p,
+        lambda match: values.get(match.group(match.lastgroup).strip())
+    )
+
+def _list_style_ids(doc) -> set:
+    """Ids of paragraph styles that number their paragraphs, directly or through their base style"""
+    numbered = {}
+    
+    def is_numbered(style) -> bool:
+        if style is None:
+            return False
+        if style.style_id not in numbered:
+            numbered[style.style_id] = False
+            p_pr = style.element.pPr
+            numbered[style.style_id] = (
+                (p_pr is not None and p_pr.numPr is not None) or is_numbered(style.base_style)
+            )
+        return numbered[style.style_id]
+    
+    return {
+        style.style_id for style in doc.styles
+        if style.type == WD_STYLE_TYPE.PARAGRAPH and is_numbered(style)
+    }
+
+def _marker_paragraph(marker: str):
+    p = OxmlElement('w:p')
+    r = OxmlElement('w:r')
+    t = OxmlElement('w:t')
+    t.text = marker
+    r.append(t)
+    p.append(r)
+    return p
+
+class CompiledTemplate:
+    """A .docx template pre-split into static XML segments and placeholder slots.
+    
+    Compiling parses the document once with python-docx and puts a marker where each
+    placeholder is. Rendering only joins the segments with the escaped values and
+    zips the result with the untouched parts, so no document object model is built
+    per render.
+    
+    The body is also split into blocks (a top-level paragraph or table, or a run of
+    list paragraphs), so the preview of only the blocks containing some placeholders
+    can be re-rendered.
+    """
+    
+    SLOT_MARKER = re.compile("\ue000(\\d+)\ue001".encode())
+    BLOCK_MARKER = re.compile(
+        b'<w:p(?: [^>]*)?><w:r><w:t>' + "\ue002(\\d+)\ue003".encode() + b'</w:t></w:r></w:p>'
+    )
+    HTML_BLOCK_MARKER = re.compile("<p>\ue002(\\d+)\ue003</p>")
     
     def __init__(self, file_path: str):
-        self.file_path = file_path
-        self.doc = Document(file_path)
+        with span("compile_template"):
+            self._compile(file_path)
+    
+    def _compile(self, file_path: str):
+        doc = Document(file_path)
+        with zipfile.ZipFile(file_path) as source:
+            self.parts = [(info, source.read(info.filename)) for info in source.infolist()]
+        self.document_part = doc.part.partname.lstrip("/")
         
-    def extract_text(self) -> str:
-        full_text = []
-        for para in self.doc.paragraphs:
-            full_text.append(para.text)
+        self.slots: List[Tuple[str, str]] = []      # (key, original placeholder text)
         
-        for table in self.doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    full_text.append(cell.text)
+        def mark_slot(match):
+            self.slots.append((match.group(match.lastgroup).strip(), match.group(0)))
+            return f"\ue000{len(self.slots) - 1}\ue001"
         
-        return "\n".join(full_text)
-    
-    def detect_placeholders(self) -> List[str]:
-        text = self.extract_text()
-        
-        patterns = [
-            r'\{([^}]+)\}',           # {placeholder}
-            r'\[([^\]]+)\]',          # [PLACEHOLDER]
-            r'\{\{([^}]+)\}\}',       # {{placeholder}}
-            r'__+([A-Z_\s]+)__+',     # ___PLACEHOLDER___
-            r'\$\{([^}]+)\}',         # ${placeholder}
+        body = doc.element.body
+        for p in body.iter(qn('w:p')):
+            _splice_placeholders(p, mark_slot)
+        
+        # Group body children into blocks; consecutive list items stay together so
+        # the preview of a partial render has the same lists as the full one
+        list_styles = _list_style_ids(doc)
+        block_starts = []
+        previous_is_list = False
+        for child in body:
+            if child.tag == qn('w:sectPr'):
+                continue
+            is_list = child.tag == qn('w:p') and (
+                child.find(f"{qn('w:pPr')}/{qn('w:numPr')}") is not None
+                or child.style in list_styles
+            )
+            if not (is_list and previous_is_list):
+                block_starts.append(child)
+            previous_is_list = is_list
+        
+        for n, child in enumerate(block_starts):
+            child.addprevious(_marker_paragraph(f"\ue002{n}\ue003"))
+        end_marker = _marker_paragraph(f"\ue002{len(block_starts)}\ue003")
+        section = body.find(qn('w:sectPr'))
+        if section is not None:
+            section.addprevious(end_marker)
+        else:
+            body.append(end_marker)
+        
+        xml = etree.tostring(doc.element, xml_declaration=True, encoding="UTF-8", standalone=True)
+        # split() alternates XML and block numbers: head, 0, block 0, ..., N, tail
+        pieces = self.BLOCK_MARKER.split(xml)
+        self.head = self._compile_piece(pieces[0])
+        self.blocks = [self._compile_piece(piece) for piece in pieces[2:-2:2]]
+        self.tail = self._compile_piece(pieces[-1])
+        
+        self.block_keys = [
+            {self.slots[slot][0] for slot in slot_order}
+            for _, slot_order in self.blocks
         ]
         
-        placeholders = set()
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            placeholders.update([m.strip() for m in matches])
+        # Headers, footers, footnotes and endnotes get their own slots; the body's text
+        # boxes are already covered since body.iter() reaches their paragraphs
+        self.other_parts: Dict[str, Tuple[List[bytes], List[int]]] = {}
+        with zipfile.ZipFile(file_path) as source:
+            for kind, part in text_parts(source):
+                if part == self.document_part:
+                    continue
+                root = parse_xml(source.read(part))
+                marked = [_splice_placeholders(p, mark_slot) for p in root.iter(qn('w:p'))]
+                if any(marked):
+                    xml = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+                    self.other_parts[part] = self._compile_piece(xml)
+    
+    def _compile_piece(self, xml: bytes) -> Tuple[List[bytes], List[int]]:
+        pieces = self.SLOT_MARKER.split(xml)
+        # split() alternates static XML and slot numbers
+        return pieces[0::2], [int(n) for n in pieces[1::2]]
+    
+    def _fill_piece(self, piece: Tuple[List[bytes], List[int]], values: Dict[str, str], out: List[bytes]):
+        segments, slot_order = piece
+        out.append(segments[0])
+        for slot, segment in zip(slot_order, segments[1:]):
+            key, original = self.slots[slot]
+            value = values.get(key)
+            out.append(escape(str(value) if value is not None else original).encode())
+            out.append(segment)
+    
+    def _document_xml(self, values: Dict[str, str], blocks: List[int] = None, markers: bool = False) -> bytes:
+        out = []
+        self._fill_piece(self.head, values, out)
+        for n in (range(len(self.blocks)) if blocks is None else blocks):
+            if markers:
+                out.append(f"<w:p><w:r><w:t>\ue002{n}\ue003</w:t></w:r></w:p>".encode())
+            self._fill_piece(self.blocks[n], values, out)
+        if markers:
+            out.append(f"<w:p><w:r><w:t>\ue002{len(self.blocks)}\ue003</w:t></w:r></w:p>".encode())
+        self._fill_piece(self.tail, values, out)
+        return b"".join(out)
+    
+    def _zip(self, document_xml: bytes, values: Dict[str, str]) -> bytes:
+        # Fast compression level: deflate dominates render time at the default level
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as target:
+            for info, data in self.parts:
+                if info.filename == self.document_part:
+                    data = document_xml
+                elif info.filename in self.other_parts:
+                    out = []
+                    self._fill_piece(self.other_parts[info.filename], values, out)
+                    data = b"".join(out)
+                target.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+        return buffer.getvalue()
+    
+    def render(self, values: Dict[str, str]) -> bytes:
+        """Return the filled .docx as bytes; placeholders without a value stay as they are"""
+        with span("fill_template"):
+            document_xml = self._document_xml(values)
+        with span("save_docx"):
+            return self._zip(document_xml, values)
+    
+    def blocks_for(self, keys) -> List[int]:
+        """Blocks containing any of the given placeholders"""
+        keys = set(keys)
+        return [n for n, block_keys in enumerate(self.block_keys) if block_keys & keys]
+    
+    def preview_blocks(self, values: Dict[str, str], blocks: List[int] = None) -> Dict[int, str]:
+        """HTML of each requested block (all by default).
         
-        filtered = [p for p in placeholders if len(p) > 1 and not p.isdigit()]
-        print(f"Detected placeholders: {filtered}") 
+        The entry under len(self.blocks) holds whatever mammoth adds after the body,
+        such as footnotes.
+        """
+        docx_bytes = self._zip(self._document_xml(values, blocks, markers=True), values)
+        with span("mammoth_html", blocks=len(self.blocks) if blocks is None else len(blocks)):
+            html = mammoth.convert_to_html(io.BytesIO(docx_bytes)).value
         
-        return sorted(list(set(filtered)))
+        # split() alternates HTML and block numbers: leading, 0, block 0, ..., N, trailing
+        pieces = self.HTML_BLOCK_MARKER.split(html)
+        return {int(n): fragment for n, fragment in zip(pieces[1::2], pieces[2::2])}
+
+_compiled_templates: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+
+def get_compiled_template(file_path: str, template_hash: str) -> CompiledTemplate:
+    """Compiled template for the file, cached per template hash"""
+    compiled = _compiled_templates.get(template_hash)
+    if compiled is None:
+        compiled = CompiledTemplate(file_path)
+        _compiled_templates[template_hash] = compiled
+        while len(_compiled_templates) > COMPILED_TEMPLATE_CACHE_SIZE:
+            _compiled_templates.popitem(last=False)
+    _compiled_templates.move_to_end(template_hash)
+    return compiled
+
+class PlaceholderOccurrence(NamedTuple):
+    key: str
+    form: str               # syntax group name, e.g. "bracket"
+    text: str               # exact matched text including delimiters
+    location: Tuple         # ("paragraph", i), ("cell", table, row, column), see docx_text.TextNode
+    node_start: int         # offsets inside the paragraph / cell text
+    node_end: int
+    start: int              # offsets inside the full extracted text
+    end: int
+
+class PlaceholderIndex:
+    """Every placeholder occurrence in a document, found with a single regex pass.
+    
+    Built once per document; text, placeholder list and context lookups are then
+    served from the index instead of rescanning the document.
+    """
+    
+    def __init__(self, nodes: Iterable[Tuple[Tuple, str]]):
+        # nodes may be a stream: it is consumed once and only the joined text is kept
+        texts = []
+        self.occurrences: Dict[str, List[PlaceholderOccurrence]] = {}
+        self._contexts: Dict[Tuple[str, int], str] = {}
+        
+        offset = 0
+        for location, node_text in nodes:
+            texts.append(node_text)
+            for match in PLACEHOLDER_PATTERN.finditer(node_text):
+                key = match.group(match.lastgroup).strip()
+                if len(key) <= 1 or key.isdigit():
+                    continue
+                self.occurrences.setdefault(key, []).append(PlaceholderOccurrence(
+                    key, match.lastgroup, match.group(0), location,
+                    match.start(), match.end(), offset + match.start(), offset + match.end()
+                ))
+            offset += len(node_text) + 1
+        self.node_count = len(texts)
+        self.text = "\n".join(texts)
+    
+    @classmethod
+    def from_file(cls, file_path: str) -> "PlaceholderIndex":
+        """Index built from the streamed text of every part (see docx_text.iter_text_nodes)"""
+        return cls(iter_text_nodes(file_path))
+    
+    @classmethod
+    def from_document(cls, doc) -> "PlaceholderIndex":
+        nodes = []
+        for i, para in enumerate(doc.paragraphs):
+            nodes.append((("paragraph", i), para.text))
+        
+        # row.cells repeats a merged cell for every grid position it spans; keep the first
+        seen_cells = set()
+        for t, table in enumerate(doc.tables):
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    if cell._tc in seen_cells:
+                        continue
+                    seen_cells.add(cell._tc)
+                    nodes.append((("cell", t, r, c), cell.text))
+        
+        return cls(nodes)
+    
+    def placeholders(self) -> List[str]:
+        return sorted(self.occurrences)
+    
+    def locations(self, placeholder: str) -> List[Tuple]:
+        """Paragraphs and cells containing the placeholder, in document order"""
+        return list(dict.fromkeys(o.location for o in self.occurrences.get(placeholder, [])))
+    
+    def context(self, placeholder: str, context_chars: int = 300) -> str:
+        """Text around the first occurrence of the placeholder"""
+        cache_key = (placeholder, context_chars)
+        if cache_key not in self._contexts:
+            occurrences = self.occurrences.get(placeholder)
+            if not occurrences:
+                return ""
+            first = occurrences[0]
+            start = max(0, first.start - context_chars)
+            end = min(len(self.text), first.end + context_chars)
+            self._contexts[cache_key] = self.text[start:end]
+        return self._contexts[cache_key]
+
+def preview_block_id(block: int) -> str:
+    return f"lexsy-block-{block}"
+
+def _styled_preview(html_content: str) -> str:
+    return f"""
+    <div class="document-preview">
+        <style>
+            .document-preview {{
+                font-family: 'Times New Roman', serif;
+                line-height: 1.6;
+                padding: 40px;
+                background: white;
+                max-width: 800px;
+                margin: 0 auto;
+                box-shadow: 0 0 10px rgba(0,0,0,0.1);
+            }}
+            .document-preview p {{
+                margin-bottom: 12px;
+            }}
+            .document-preview table {{
+                width: 100%;
+                border-collapse: collapse;
+                margin: 20px 0;
+            }}
+            .document-preview table td, .document-preview table th {{
+                border: 1px solid #ddd;
+                padding: 8px;
+            }}
+        </style>
+        {html_content}
+    </div>
+    """
+
+class DocumentProcessor:
+    
+    def __init__(self, file_path: str, extraction: str = TEXT_EXTRACTION):
+        self.file_path = file_path
+        self._doc = None
+        if extraction == "stream":
+            with span("extract_text"):
+                self.index = PlaceholderIndex.from_file(file_path)
+        else:
+            with span("index_placeholders"):
+                self.index = PlaceholderIndex.from_document(self.doc)
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        self.template_hash = digest.hexdigest()
+    
+    @property
+    def doc(self):
+        """python-docx object model of the template, parsed on first access"""
+        if self._doc is None:
+            with span("parse_docx"):
+                self._doc = Document(self.file_path)
+        return self._doc
+        
+    def extract_text(self) -> str:
+        return self.index.text
+    
+    def detect_placeholders(self) -> List[str]:
+        placeholders = self.index.placeholders()
+        print(f"Detected placeholders: {placeholders}") 
+        
+        return placeholders
 
 
     def fill_template(self, placeholder_values: Dict[str, str], output_path: str):
-        """Replace placeholders with actual values - reload fresh document each time"""
-        
-        doc = Document(self.file_path)
-        
-        # Process paragraphs
-        for para in doc.paragraphs:
-            original_text = para.text
-            modified_text = original_text
-            
-            for key, value in placeholder_values.items():
-                formats = [
-                    f"{{{key}}}",           # {key}
-                    f"[{key}]",             # [key]
-                    f"{{{{{key}}}}}",       # {{key}}
-                    f"${{{key}}}",          # ${key}
-                    f"$[{key}]",            # $[key]
-                    key                     # raw key
-                ]
-                
-                for fmt in formats:
-                    if fmt in modified_text:
-                        modified_text = modified_text.replace(fmt, str(value))
-            
-            if modified_text != original_text:
-                para.text = modified_text
-        
-        # Process tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    original_text = cell.text
-                    modified_text = original_text
-                    
-                    for key, value in placeholder_values.items():
-                        formats = [
-                            f"{{{key}}}",
-                            f"[{key}]",
-                            f"{{{{{key}}}}}",
-                            f"${{{key}}}",
-                            f"$[{key}]",
-                            key
-                        ]
-                        
-                        for fmt in formats:
-                            if fmt in modified_text:
-                                modified_text = modified_text.replace(fmt, str(value))
-                    
-                    if modified_text != original_text:
-                        cell.text = modified_text
-   
-        doc.save(output_path)
+        """Replace placeholders with actual values, always starting from the original template"""
+        
+        with open(output_path, "wb") as f:
+            f.write(self.render(placeholder_values))
         print(f"Document saved to: {output_path}")  
         print(f"Values used: {placeholder_values}")
 
+    def render(self, placeholder_values: Dict[str, str]) -> bytes:
+        """Filled document as .docx bytes, rendered from the cached compiled template"""
+        return get_compiled_template(self.file_path, self.template_hash).render(placeholder_values)
 
     def generate_html_preview(self, file_path: str) -> str:
         """Convert DOCX to HTML for preview"""
         try:
             with open(file_path, "rb") as docx_file:
-                result = mammoth.convert_to_html(docx_file)
-                html_content = result.value
-        
-                styled_html = f"""
-                <div class="document-preview">
-                    <style>
-                        .document-preview {{
-                            font-family: 'Times New Roman', serif;
-                            line-height: 1.6;
-                            padding: 40px;
-                            background: white;
-                            max-width: 800px;
-                            margin: 0 auto;
-                            box-shadow: 0 0 10px rgba(0,0,0,0.1);
-                        }}
-                        .document-preview p {{
-                            margin-bottom: 12px;
-                        }}
-                        .document-preview table {{
-                            width: 100%;
-                            border-collapse: collapse;
-                            margin: 20px 0;
-                        }}
-                        .document-preview table td, .document-preview table th {{
-                            border: 1px solid #ddd;
-                            padding: 8px;
-                        }}
-                    </style>
-                    {html_content}
-                </div>
-                """
-                return styled_html
+                return self.html_preview(docx_file.read())
         except Exception as e:
             return f"<p>Error generating preview: {str(e)}</p>"
 
-    def get_placeholder_context(self, placeholder: str, context_chars: int = 300) -> str:
-        text = self.extract_text()
-
-        formats = [
-            f"{{{placeholder}}}",
-            f"[{placeholder}]",
-            f"{{{{{placeholder}}}}}",
-            f"${{{placeholder}}}",
-            placeholder 
-        ]
+    def html_preview(self, docx_bytes: bytes) -> str:
+        """Convert DOCX bytes to HTML for preview"""
+        try:
+            with span("mammoth_html"):
+                result = mammoth.convert_to_html(io.BytesIO(docx_bytes))
+            return _styled_preview(result.value)
+        except Exception as e:
+            return f"<p>Error generating preview: {str(e)}</p>"
 
-        for fmt in formats:
-            if fmt in text:
-                pos = text.find(fmt)
-                
-                start = max(0, pos - context_chars)
-                end = min(len(text), pos + len(fmt) + context_chars)
-                
-                context = text[start:end]
-                
-                context = context.replace('\n', ' ').strip()
-                
-                return context
-
-        return ""
+    def preview(self, placeholder_values: Dict[str, str]) -> str:
+        """HTML preview of the filled template with every block in its own element, see preview_patch"""
+        try:
+            compiled = get_compiled_template(self.file_path, self.template_hash)
+            blocks = compiled.preview_blocks(placeholder_values)
+            trailing = blocks.pop(len(compiled.blocks), "")
+            html_content = "".join(
+                f'<div class="doc-block" id="{preview_block_id(n)}">{html}</div>'
+                for n, html in blocks.items()
+            )
+            return _styled_preview(html_content + trailing)
+        except Exception as e:
+            return f"<p>Error generating preview: {str(e)}</p>"
+
+    def preview_patch(self, placeholder_values: Dict[str, str], changed_keys) -> Dict[str, str]:
+        """New inner HTML of the preview blocks affected by changed_keys, keyed by element id"""
+        compiled = get_compiled_template(self.file_path, self.template_hash)
+        blocks = compiled.blocks_for(changed_keys)
+        if not blocks:
+            return {}
+        
+        fragments = compiled.preview_blocks(placeholder_values, blocks)
+        return {preview_block_id(n): fragments.get(n, "") for n in blocks}
 
+    def get_placeholder_context(self, placeholder: str, context_chars: int = 300) -> str:
+        return self.index.context(placeholder, context_chars).replace('\n', ' ').strip()
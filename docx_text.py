@@ -0,0 +1,154 @@
+import re
+import zipfile
+from typing import IO, Iterator, List, NamedTuple, Tuple, Union
+from lxml import etree
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+MC = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+
+def _w(tag: str) -> str:
+    return f"{{{W}}}{tag}"
+
+P, T, TC, TR, TBL = _w("p"), _w("t"), _w("tc"), _w("tr"), _w("tbl")
+R, HYPERLINK, INS = _w("r"), _w("hyperlink"), _w("ins")
+BODY, TXBX_CONTENT = _w("body"), _w("txbxContent")
+FALLBACK = f"{{{MC}}}Fallback"
+
+CONTENT_TYPES = "[Content_Types].xml"
+CT = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+# Parts with text, by the suffix of their content type, in the order they are read
+TEXT_PART_KINDS = [
+    ("document", ".document.main+xml"),
+    ("document", ".template.main+xml"),
+    ("header", ".header+xml"),
+    ("footer", ".footer+xml"),
+    ("footnote", ".footnotes+xml"),
+    ("endnote", ".endnotes+xml"),
+]
+
+# Paragraph containers, so top-level text keeps a stable location
+PART_ROOTS = {_w("body"), _w("hdr"), _w("ftr"), _w("footnote"), _w("endnote")}
+
+class TextNode(NamedTuple):
+    location: Tuple     # ("paragraph", i), ("cell", table, row, cell), ("textbox", i) or (kind, part, i)
+    text: str
+
+def text_parts(source: zipfile.ZipFile) -> List[Tuple[str, str]]:
+    """(kind, part name) of every part with document text, main document first"""
+    root = etree.fromstring(source.read(CONTENT_TYPES))
+    overrides = [
+        (o.get("PartName").lstrip("/"), o.get("ContentType", ""))
+        for o in root.iter(f"{{{CT}}}Override")
+    ]
+    parts = []
+    for kind, suffix in TEXT_PART_KINDS:
+        names = sorted(
+            (name for name, content_type in overrides if content_type.endswith(suffix)),
+            key=lambda name: [int(s) if s.isdigit() else s for s in re.split(r"(\d+)", name)]
+        )
+        parts.extend((kind, name) for name in names)
+    return parts
+
+def _is_direct_text(t) -> bool:
+    """w:t of a run directly in a paragraph (or in its hyperlinks and insertions),
+    the same text _splice_placeholders fills"""
+    run = t.getparent()
+    if run is None or run.tag != R:
+        return False
+    parent = run.getparent()
+    if parent is not None and parent.tag in (HYPERLINK, INS):
+        parent = parent.getparent()
+    return parent is not None and parent.tag == P
+
+def _release(elem):
+    """Drop a finished element and the siblings before it, so memory stays flat"""
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+def _iter_part(stream: IO[bytes], kind: str, part: str, counters: dict) -> Iterator[TextNode]:
+    paragraphs: List[List[str]] = []    # text of the open paragraphs, innermost last
+    cells: List[List[str]] = []         # paragraph texts of the open table cells
+    table_stack: List[List[int]] = []   # [table number, row, cell] per open table
+    fallback = 0                        # inside mc:Fallback, a duplicate of the mc:Choice content
+
+    events = etree.iterparse(
+        stream, events=("start", "end"), tag=(P, T, TC, TR, TBL, FALLBACK),
+        huge_tree=True, remove_comments=True
+    )
+    for event, elem in events:
+        tag = elem.tag
+        if tag == FALLBACK:
+            fallback += 1 if event == "start" else -1
+            if event == "end":
+                _release(elem)
+            continue
+        if fallback:
+            continue
+
+        if event == "start":
+            if tag == P:
+                paragraphs.append([])
+            elif tag == TC:
+                cells.append([])
+            elif tag == TR:
+                table_stack[-1][1] += 1
+                table_stack[-1][2] = -1
+            elif tag == TBL:
+                table_stack.append([counters["table"], -1, -1])
+                counters["table"] += 1
+            continue
+
+        if tag == T:
+            if paragraphs and elem.text and _is_direct_text(elem):
+                paragraphs[-1].append(elem.text)
+        elif tag == P:
+            text = "".join(paragraphs.pop())
+            parent = elem.getparent()
+            parent_tag = parent.tag if parent is not None else None
+            if parent_tag == TC and cells:
+                cells[-1].append(text)
+            elif text:
+                if parent_tag == TXBX_CONTENT:
+                    location = ("textbox", counters["textbox"])
+                    counters["textbox"] += 1
+                elif kind == "document" and parent_tag == BODY:
+                    location = ("paragraph", counters["paragraph"])
+                else:
+                    location = (kind, part, counters[part])
+                    counters[part] += 1
+                yield TextNode(location, text)
+            if kind == "document" and parent_tag == BODY:
+                counters["paragraph"] += 1
+            _release(elem)
+        elif tag == TC:
+            table_stack[-1][2] += 1
+            text = "\n".join(cells.pop())
+            # Each w:tc is seen once, so merged cells are not repeated per grid position
+            if text:
+                table, row, cell = table_stack[-1]
+                yield TextNode(("cell", table, row, cell), text)
+            _release(elem)
+        elif tag == TR:
+            _release(elem)
+        elif tag == TBL:
+            table_stack.pop()
+            _release(elem)
+
+def iter_text_nodes(file: Union[str, IO[bytes]]) -> Iterator[TextNode]:
+    """Text of every paragraph and table cell of a .docx, in reading order.
+
+    Streams the main document, then headers, footers, footnotes and endnotes,
+    straight from the zip with an incremental XML parser and frees each element once
+    it is read, so memory does not grow with the document. Text boxes are included
+    once (the mc:Fallback copy is skipped) and empty nodes are left out.
+    """
+    with zipfile.ZipFile(file) as source:
+        counters = {"paragraph": 0, "table": 0, "textbox": 0}
+        for kind, part in text_parts(source):
+            counters.setdefault(part, 0)
+            with source.open(part) as stream:
+                yield from _iter_part(stream, kind, part, counters)
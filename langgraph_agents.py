@@ -1,21 +1,87 @@
-from typing import TypedDict, Annotated, List, Dict
-from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-import operator
+from typing import TYPE_CHECKING, TypedDict, AsyncIterator, List, Dict, Union
+from pydantic import BaseModel
+import asyncio
 import json
 import os
 from dotenv import load_dotenv
+from llm_scheduler import LLM_TIMEOUT, LLMScheduler
+from question_cache import QuestionCache
+from validators import LocalValidator
+from prompt_builder import PROMPT_TOKEN_BUDGET, batch_context, plan_batches
+
+# langgraph, langchain and openai take most of the startup time, so they are imported
+# on first use: in get_llm(), get_document_workflow() and the message helpers below
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
-# Verify API key is loaded
+# Checked when the LLM client is first needed (see get_llm and /api/ready), not at import
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment variables!")
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+
+# "batch" generates every question at upload time, "incremental" asks the LLM once per step
+QUESTION_MODE = os.getenv("QUESTION_MODE", "batch")
+QUESTION_BATCH_SIZE = int(os.getenv("QUESTION_BATCH_SIZE", "15"))
+# Answers per structured validation call of avalidate_answers; chunks run concurrently
+VALIDATION_BATCH_SIZE = int(os.getenv("VALIDATION_BATCH_SIZE", "20"))
+
+# Answer obvious validations (amounts, dates, emails, ...) locally instead of calling the LLM
+LOCAL_VALIDATION = os.getenv("LOCAL_VALIDATION", "1") == "1"
+
+local_validator = LocalValidator()
+
+# Bump when the question prompts change so cached questions are not reused
+QUESTION_PROMPT_VERSION = "2"
+
+question_cache = QuestionCache(
+    max_entries=int(os.getenv("QUESTION_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("QUESTION_CACHE_TTL", str(7 * 24 * 3600))),
+    db_path=os.getenv("QUESTION_CACHE_DB") or None,
+    max_db_entries=int(os.getenv("QUESTION_CACHE_DB_SIZE", "100000"))
+)
+
+QUESTION_TEMPERATURE = 0.7
+VALIDATION_TEMPERATURE = 0.3
+
+_llm = None
+
+def get_llm() -> "ChatOpenAI":
+    """Return the shared chat model, creating it (and its connection pools) on first use"""
+    global _llm
+    if _llm is None:
+        if not OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY not found in environment variables!")
+        import httpx
+        from langchain_openai import ChatOpenAI
+        
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS
+        )
+        _llm = ChatOpenAI(
+            model=OPENAI_MODEL,
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            # Retries and deadlines are handled by llm_scheduler
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            # Token usage on streamed responses too, for the metrics
+            stream_usage=True,
+            http_client=httpx.Client(limits=limits),
+            http_async_client=httpx.AsyncClient(limits=limits)
+        )
+    return _llm
+
+# All LLM calls go through the scheduler: concurrency and rate limits, coalescing, retries
+llm_scheduler = LLMScheduler(get_llm, default_model=OPENAI_MODEL)
 
 class DocumentState(TypedDict):
-    document_text: str
+    """Conversation state of one session. Nodes update it in place and return it;
+    session_store keeps it between requests as a compact snapshot."""
     placeholders: List[str]
     current_placeholder: str
     current_index: int
@@ -23,26 +89,27 @@ class DocumentState(TypedDict):
     user_response: str
     question: str
     validation_result: Dict
-    messages: Annotated[List, operator.add]
+    questions: Dict[str, str]
+    contexts: Dict[str, str]            # token-budgeted snippet per placeholder, see prompt_builder
+    placeholder_groups: Dict[str, List[str]]    # canonical key -> variants, see placeholder_groups
 
-def question_generator_node(state: DocumentState) -> DocumentState:
-    """Generate contextual questions for placeholders"""
-    
-    llm = ChatOpenAI(
-        model="gpt-4o", 
-        temperature=0.7,
-        api_key=OPENAI_API_KEY
-    )
-    
-    current_index = state['current_index']
-    placeholders = state['placeholders']
-    
-    if current_index >= len(placeholders):
-        return state
-    
-    current_placeholder = placeholders[current_index]
-    
-    system_prompt = """You are a legal assistant specializing in document completion.
+class GeneratedQuestion(BaseModel):
+    placeholder: str
+    question: str
+
+class GeneratedQuestions(BaseModel):
+    questions: List[GeneratedQuestion]
+
+class ValidatedAnswer(BaseModel):
+    placeholder: str
+    valid: bool
+    formatted_value: str
+    feedback: str
+
+class ValidatedAnswers(BaseModel):
+    results: List[ValidatedAnswer]
+
+QUESTION_SYSTEM_PROMPT = """You are a legal assistant specializing in document completion.
     Generate clear, specific questions that help users understand exactly what information is needed.
     
     For legal documents like SAFE agreements, NDAs, contracts:
@@ -52,50 +119,176 @@ def question_generator_node(state: DocumentState) -> DocumentState:
     - For legal terms: Provide brief explanations
     
     Make questions conversational yet professional."""
+
+def _placeholder_context(state: DocumentState, placeholder: str) -> str:
+    """Context snippet of the placeholder, precomputed at upload"""
+    return (state.get('contexts') or {}).get(placeholder, "")
+
+def _question_messages(state: DocumentState) -> List:
+    """Build the prompt for the question of the current placeholder"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    current_placeholder = state['placeholders'][state['current_index']]
+    context = _placeholder_context(state, current_placeholder)
     
-    # Extract context around placeholder
-    doc_text = state['document_text']
-    context = ""
-    
-    search_patterns = [f"{{{current_placeholder}}}", f"[{current_placeholder}]", current_placeholder]
-    for pattern in search_patterns:
-        if pattern in doc_text:
-            pos = doc_text.find(pattern)
-            start = max(0, pos - 200)
-            end = min(len(doc_text), pos + len(pattern) + 200)
-            context = doc_text[start:end]
-            break
-    
-    messages = [
-        SystemMessage(content=system_prompt),
+    return [
+        SystemMessage(content=QUESTION_SYSTEM_PROMPT),
         HumanMessage(content=f"""
         Placeholder: {current_placeholder}
-        Document context: {context if context else doc_text[:300]}
+        Document context: {context}
         
         Generate ONE clear question to collect this information. Return only the question.
         """)
     ]
+
+def _question_update(state: DocumentState, question: str) -> DocumentState:
+    state['question'] = question
+    state['current_placeholder'] = state['placeholders'][state['current_index']]
+    return state
+
+def _question_cache_key(state: DocumentState, placeholder: str) -> str:
+    return QuestionCache.make_key(
+        placeholder,
+        _placeholder_context(state, placeholder),
+        f"{QUESTION_PROMPT_VERSION}:{OPENAI_MODEL}"
+    )
+
+def _cached_question_update(state: DocumentState, question: str) -> DocumentState:
+    placeholder = state['placeholders'][state['current_index']]
+    question_cache.set(_question_cache_key(state, placeholder), question)
+    return _question_update(state, question)
+
+async def _acached_question_update(state: DocumentState, question: str) -> DocumentState:
+    placeholder = state['placeholders'][state['current_index']]
+    await question_cache.aset_many({_question_cache_key(state, placeholder): question})
+    return _question_update(state, question)
+
+def _pregenerated_question(state: DocumentState) -> str:
+    """Question from the upload-time batch or the cross-session cache, if any"""
+    placeholder = state['placeholders'][state['current_index']]
+    question = state.get('questions', {}).get(placeholder)
+    if question:
+        return question
+    return question_cache.get(_question_cache_key(state, placeholder)) or ""
+
+async def _apregenerated_question(state: DocumentState) -> str:
+    """_pregenerated_question without blocking the event loop on the SQLite cache"""
+    placeholder = state['placeholders'][state['current_index']]
+    question = state.get('questions', {}).get(placeholder)
+    if question:
+        return question
+    return await question_cache.aget(_question_cache_key(state, placeholder)) or ""
+
+async def _agenerate_question_batch(placeholders: List[str], state: DocumentState) -> Dict[str, str]:
+    from langchain_core.messages import HumanMessage, SystemMessage
+    messages = [
+        SystemMessage(content=QUESTION_SYSTEM_PROMPT),
+        HumanMessage(content=f"""
+        Generate ONE clear question for EACH of the following placeholders.
+        Return every placeholder exactly as written, together with its question.
+        Use the document excerpts listed for each placeholder as its context.
+        
+        {batch_context(placeholders, state.get('contexts') or {})}
+        """)
+    ]
     
-    response = llm.invoke(messages)
-    question = response.content.strip()
+    response = await llm_scheduler.ainvoke(
+        messages, operation="question_batch", temperature=QUESTION_TEMPERATURE,
+        response_format=GeneratedQuestions
+    )
+    result = GeneratedQuestions.model_validate_json(response.content)
     
-    return {
-        **state,
-        "question": question,
-        "current_placeholder": current_placeholder,
-        "messages": [AIMessage(content=question)]
-    }
+    wanted = set(placeholders)
+    return {q.placeholder: q.question.strip() for q in result.questions if q.placeholder in wanted}
 
-def validation_node(state: DocumentState) -> DocumentState:
-    """Validate user response and format appropriately"""
+async def agenerate_all_questions(state: DocumentState) -> Dict[str, str]:
+    """Generate questions for every placeholder up front, in concurrent chunks planned by prompt_builder.
+    
+    Placeholders missing from the result (e.g. a failed chunk) fall back to
+    one LLM call per question in question_generator_node.
+    """
+    keys = {placeholder: _question_cache_key(state, placeholder) for placeholder in state['placeholders']}
+    cached = await question_cache.aget_many(list(keys.values()))
+    questions = {placeholder: cached[key] for placeholder, key in keys.items() if key in cached}
+    placeholders = [placeholder for placeholder in state['placeholders'] if placeholder not in questions]
+    
+    # Chunks of up to QUESTION_BATCH_SIZE placeholders whose excerpts fit PROMPT_TOKEN_BUDGET
+    chunks = plan_batches(placeholders, state.get('contexts') or {}, QUESTION_BATCH_SIZE, PROMPT_TOKEN_BUDGET)
+    
+    results = await asyncio.gather(
+        *(_agenerate_question_batch(chunk, state) for chunk in chunks),
+        return_exceptions=True
+    )
+    
+    generated = {}
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Batch question generation failed: {result}")
+            continue
+        generated.update(result)
+    await question_cache.aset_many({keys[placeholder]: question for placeholder, question in generated.items()})
+    questions.update(generated)
+    return questions
+
+def question_generator_node(state: DocumentState) -> DocumentState:
+    """Generate contextual questions for placeholders"""
+    
+    if state['current_index'] >= len(state['placeholders']):
+        return state
     
-    llm = ChatOpenAI(
-        model="gpt-4o", 
-        temperature=0.3,
-        api_key=OPENAI_API_KEY 
+    pregenerated = _pregenerated_question(state)
+    if pregenerated:
+        return _question_update(state, pregenerated)
+    
+    response = llm_scheduler.invoke(
+        _question_messages(state), operation="question", temperature=QUESTION_TEMPERATURE
     )
     
-    system_prompt = """You are a data validation expert for legal documents.
+    return _cached_question_update(state, response.content.strip())
+
+async def aquestion_generator_node(state: DocumentState) -> DocumentState:
+    """Async version of question_generator_node, does not block the event loop"""
+    
+    if state['current_index'] >= len(state['placeholders']):
+        return state
+    
+    pregenerated = await _apregenerated_question(state)
+    if pregenerated:
+        return _question_update(state, pregenerated)
+    
+    response = await llm_scheduler.ainvoke(
+        _question_messages(state), operation="question", temperature=QUESTION_TEMPERATURE
+    )
+    
+    return await _acached_question_update(state, response.content.strip())
+
+async def astream_question_node(state: DocumentState) -> AsyncIterator[Union[str, DocumentState]]:
+    """Streaming version of aquestion_generator_node.
+    
+    Yields the question text in chunks as the LLM produces them, then the updated
+    state as the last item. A pregenerated question is yielded as a single chunk.
+    """
+    
+    if state['current_index'] >= len(state['placeholders']):
+        yield state
+        return
+    
+    pregenerated = await _apregenerated_question(state)
+    if pregenerated:
+        yield pregenerated
+        yield _question_update(state, pregenerated)
+        return
+    
+    parts = []
+    async for chunk in llm_scheduler.astream(
+        _question_messages(state), operation="question", temperature=QUESTION_TEMPERATURE
+    ):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+    
+    yield await _acached_question_update(state, "".join(parts).strip())
+
+VALIDATION_SYSTEM_PROMPT = """You are a data validation expert for legal documents.
     Validate user responses and format them appropriately.
     
     Check for:
@@ -103,11 +296,19 @@ def validation_node(state: DocumentState) -> DocumentState:
     - Reasonable values (e.g., investment amounts should be positive)
     - Proper formatting (dates, currencies, names)
     - Completeness (no missing critical information)
+    """
+
+UNCHECKED_ANSWER_FEEDBACK = "Sorry, I couldn't check that answer. Could you please enter it again?"
+
+def _validation_messages(state: DocumentState) -> List:
+    """Build the prompt validating the user response for the current placeholder"""
+    from langchain_core.messages import HumanMessage, SystemMessage
     
+    system_prompt = VALIDATION_SYSTEM_PROMPT + """
     Return ONLY valid JSON with: {"valid": true/false, "formatted_value": "...", "feedback": "..."}
     """
     
-    messages = [
+    return [
         SystemMessage(content=system_prompt),
         HumanMessage(content=f"""
         Placeholder: {state['current_placeholder']}
@@ -116,34 +317,152 @@ def validation_node(state: DocumentState) -> DocumentState:
         Validate and format this response. Return valid JSON only.
         """)
     ]
-    
-    response = llm.invoke(messages)
-    
+
+def _parse_validation(content: str) -> Dict:
+    """Parse the validator JSON; an unreadable reply asks the user again instead of accepting it"""
     try:
-        validation_result = json.loads(response.content)
-    except:
-        validation_result = {
-            "valid": True,
-            "formatted_value": state['user_response'],
-            "feedback": "Accepted"
-        }
+        validation_result = json.loads(content)
+        if isinstance(validation_result.get('valid'), bool):
+            return validation_result
+    except (ValueError, AttributeError):
+        pass
+    
+    print(f"Could not parse validation response: {content!r}")
+    return {
+        "valid": False,
+        "formatted_value": "",
+        "feedback": UNCHECKED_ANSWER_FEEDBACK
+    }
+
+def _local_validation(state: DocumentState) -> Dict:
+    """Rule-based result for obvious answers, None when the LLM has to decide"""
+    if not LOCAL_VALIDATION:
+        return None
+    placeholder = state['current_placeholder']
+    context = _placeholder_context(state, placeholder)
+    return local_validator.validate(placeholder, state['user_response'], context)
+
+def _next_open_index(state: DocumentState, values: Dict[str, str], start: int) -> int:
+    """First placeholder from start on without a value (answers submitted with
+    avalidate_answers are not asked again), len(placeholders) when all have one"""
+    placeholders = state['placeholders']
+    return next((i for i in range(start, len(placeholders)) if placeholders[i] not in values), len(placeholders))
+
+def _validation_update(state: DocumentState, validation_result: Dict) -> DocumentState:
+    """Apply the validator output to the state, in place"""
     
-    updated_values = state['collected_values'].copy()
-   
     if validation_result['valid']:
-        updated_values[state['current_placeholder']] = validation_result['formatted_value']
-        new_index = state['current_index'] + 1
-    else:
-        new_index = state['current_index']
+        state['collected_values'][state['current_placeholder']] = validation_result['formatted_value']
+        state['current_index'] = _next_open_index(state, state['collected_values'], state['current_index'] + 1)
+    state['validation_result'] = validation_result
+    return state
+
+def validation_node(state: DocumentState) -> DocumentState:
+    """Validate user response and format appropriately"""
+    
+    local_result = _local_validation(state)
+    if local_result is not None:
+        return _validation_update(state, local_result)
+    
+    response = llm_scheduler.invoke(
+        _validation_messages(state), operation="validation", temperature=VALIDATION_TEMPERATURE,
+        response_format={"type": "json_object"}
+    )
+    
+    return _validation_update(state, _parse_validation(response.content))
+
+async def avalidation_node(state: DocumentState) -> DocumentState:
+    """Async version of validation_node, does not block the event loop"""
+    
+    local_result = _local_validation(state)
+    if local_result is not None:
+        return _validation_update(state, local_result)
+    
+    response = await llm_scheduler.ainvoke(
+        _validation_messages(state), operation="validation", temperature=VALIDATION_TEMPERATURE,
+        response_format={"type": "json_object"}
+    )
+    
+    return _validation_update(state, _parse_validation(response.content))
+
+async def _avalidate_answer_batch(answers: Dict[str, str]) -> Dict[str, Dict]:
+    """Validate several answers in one structured-output call"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    
+    listed = "\n".join(f"- Placeholder: {p}\n  User response: {json.dumps(a)}" for p, a in answers.items())
+    messages = [
+        SystemMessage(content=VALIDATION_SYSTEM_PROMPT),
+        HumanMessage(content=f"""
+        Validate and format EACH of the following responses independently.
+        Return every placeholder exactly as written, with valid, formatted_value and feedback.
+        
+        {listed}
+        """)
+    ]
+    
+    response = await llm_scheduler.ainvoke(
+        messages, operation="validation_batch", temperature=VALIDATION_TEMPERATURE,
+        response_format=ValidatedAnswers
+    )
+    result = ValidatedAnswers.model_validate_json(response.content)
     
     return {
-        **state,
-        "validation_result": validation_result,
-        "collected_values": updated_values,
-        "current_index": new_index,
-        "messages": [AIMessage(content=validation_result.get('feedback', 'Validated'))]
+        r.placeholder: {"valid": r.valid, "formatted_value": r.formatted_value, "feedback": r.feedback}
+        for r in result.results if r.placeholder in answers
     }
 
+async def avalidate_answers(state: DocumentState, answers: Dict[str, str]) -> DocumentState:
+    """Validate many answers at once, for form-style submission.
+    
+    Obvious answers are checked locally, the rest in concurrent structured-output calls
+    of VALIDATION_BATCH_SIZE answers, so a whole form takes about one LLM round trip.
+    Answers may use any spelling of a grouped placeholder. Accepted values are stored and
+    current_index moves to the first placeholder still without a value. The per-field
+    results are in validation_result["fields"].
+    """
+    canonical = {p: p for p in state['placeholders']}
+    for key, variants in (state.get('placeholder_groups') or {}).items():
+        canonical.update((variant, key) for variant in variants)
+    
+    results: Dict[str, Dict] = {}
+    pending: Dict[str, str] = {}
+    for key, answer in answers.items():
+        placeholder = canonical.get(key)
+        if placeholder is None:
+            results[key] = {"valid": False, "formatted_value": "", "feedback": "This document has no such placeholder."}
+            continue
+        local_result = None
+        if LOCAL_VALIDATION:
+            local_result = local_validator.validate(placeholder, answer, _placeholder_context(state, placeholder))
+        if local_result is not None:
+            results[placeholder] = local_result
+        else:
+            pending[placeholder] = answer
+    
+    keys = list(pending)
+    chunks = [keys[i:i + VALIDATION_BATCH_SIZE] for i in range(0, len(keys), VALIDATION_BATCH_SIZE)]
+    chunk_results = await asyncio.gather(
+        *(_avalidate_answer_batch({p: pending[p] for p in chunk}) for chunk in chunks),
+        return_exceptions=True
+    )
+    for chunk, result in zip(chunks, chunk_results):
+        if isinstance(result, Exception):
+            print(f"Batch validation failed: {result}")
+            result = {}
+        for placeholder in chunk:
+            # Left out of the reply or a failed call: ask for that field again
+            results[placeholder] = result.get(placeholder) or {
+                "valid": False, "formatted_value": "", "feedback": UNCHECKED_ANSWER_FEEDBACK
+            }
+    
+    for placeholder, result in results.items():
+        if result['valid'] and placeholder in canonical:
+            state['collected_values'][placeholder] = result['formatted_value']
+    state['current_index'] = _next_open_index(state, state['collected_values'], 0)
+    accepted = sum(1 for r in results.values() if r['valid'])
+    state['validation_result'] = {"valid": accepted == len(results), "fields": results}
+    return state
+
 def continue_process(state: DocumentState) -> str:
     """Determine if we should continue or end"""
     if state['current_index'] >= len(state['placeholders']):
@@ -159,13 +478,21 @@ def ask_again(state: DocumentState) -> str:
 
 # Build the LangGraph workflow
 def create_document_workflow():
+    from langgraph.graph import StateGraph, END
+    from langchain_core.runnables import RunnableLambda
     
     # Create state graph
     workflow = StateGraph(DocumentState)
     
-    # Add nodes
-    workflow.add_node("question_generator", question_generator_node)
-    workflow.add_node("validator", validation_node)
+    # Add nodes (sync and async implementations, so both invoke and ainvoke work)
+    workflow.add_node(
+        "question_generator",
+        RunnableLambda(question_generator_node, afunc=aquestion_generator_node)
+    )
+    workflow.add_node(
+        "validator",
+        RunnableLambda(validation_node, afunc=avalidation_node)
+    )
     
     # Set entry point
     workflow.set_entry_point("question_generator")
@@ -183,3 +510,12 @@ def create_document_workflow():
     )
     
     return workflow.compile()
+
+_document_workflow = None
+
+def get_document_workflow():
+    """Return the shared compiled workflow, building it on first use"""
+    global _document_workflow
+    if _document_workflow is None:
+        _document_workflow = create_document_workflow()
+    return _document_workflow
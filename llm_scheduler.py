@@ -0,0 +1,388 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from metrics import record_llm_call, record_llm_queue_wait
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "0"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+
+_retryable_errors = None
+
+def retryable_errors() -> Tuple:
+    """Errors worth another attempt; everything else (bad request, auth, ...) fails at once.
+    
+    Resolved on first use: importing openai is slow and only needed once a call fails.
+    """
+    global _retryable_errors
+    if _retryable_errors is None:
+        import openai
+        _retryable_errors = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+    return _retryable_errors
+
+class LLMTimeout(Exception):
+    """The call did not finish before its deadline, queueing and retries included"""
+
+class TokenBucket:
+    """Allows `rate` calls per second on average with bursts of up to `burst` calls.
+    Shared by async calls and blocking calls from other threads."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take the next token and return the seconds until it may be used, or None
+        (taking nothing) when that is more than max_wait. Tokens are reserved ahead,
+        so they go out in arrival order."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+class LLMScheduler:
+    """Single entry point for LLM calls.
+
+    Every call waits for a slot of its model's concurrency semaphore and a token of
+    the rate limiter, runs against one deadline that covers queueing and retries,
+    and is retried with exponential backoff and jitter on rate limits, connection
+    errors and server errors. Identical prompts already in flight are coalesced:
+    later callers wait for the same response instead of paying for another call.
+    Blocking calls from the sync graph nodes get the same treatment, with thread
+    semaphores and the same rate limiter.
+    """
+
+    def __init__(self, llm_factory: Callable, default_model: str,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, rate_per_second: float = LLM_RATE_PER_SECOND,
+                 burst: int = LLM_RATE_BURST, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, retry_base_delay: float = LLM_RETRY_BASE_DELAY):
+        self.llm_factory = llm_factory
+        self.default_model = default_model
+        self.max_concurrency = max_concurrency
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._bucket = TokenBucket(rate_per_second, burst) if rate_per_second > 0 else None
+        self._in_flight: Dict[str, list] = {}   # prompt key -> [task, waiters]
+        # Blocking calls, from any thread
+        self._thread_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._thread_in_flight: Dict[str, Future] = {}
+        self._thread_lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.wait_seconds = deque(maxlen=1000)
+
+    @staticmethod
+    def make_key(model: str, messages: List, params: Dict) -> str:
+        prompt = [(m.type, m.content) for m in messages]
+        raw = json.dumps([model, prompt, params], sort_keys=True, default=repr)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.timeouts += 1
+            raise LLMTimeout(f"LLM call exceeded its {self.timeout:g}s deadline")
+        return remaining
+
+    def _queue_timeout(self) -> LLMTimeout:
+        self.timeouts += 1
+        return LLMTimeout(f"LLM call waited longer than its {self.timeout:g}s deadline")
+
+    def _waited(self, model: str, queued_at: float):
+        seconds = time.monotonic() - queued_at
+        self.wait_seconds.append(seconds)
+        record_llm_queue_wait(model, seconds)
+
+    def _rate_wait(self, deadline: float) -> float:
+        """Seconds to wait for a rate token, which is taken now"""
+        if self._bucket is None:
+            return 0.0
+        wait = self._bucket.reserve(self._remaining(deadline))
+        if wait is None:
+            raise self._queue_timeout()
+        return wait
+
+    async def _admit(self, model: str, deadline: float) -> asyncio.Semaphore:
+        """Wait for a concurrency slot and a rate token; returns the semaphore to release"""
+        # Created lazily so they bind to the running event loop
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores[model] = asyncio.Semaphore(self.max_concurrency)
+
+        queued_at = time.monotonic()
+        self.queued += 1
+        try:
+            await self._acquire(semaphore, deadline)
+            try:
+                wait = self._rate_wait(deadline)
+                if wait:
+                    await asyncio.sleep(wait)
+            except BaseException:
+                semaphore.release()
+                raise
+        except asyncio.TimeoutError:
+            raise self._queue_timeout()
+        finally:
+            self.queued -= 1
+        self._waited(model, queued_at)
+        return semaphore
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, deadline: float):
+        """semaphore.acquire() before the deadline, without leaking a permit when the
+        timeout (or a cancellation) arrives just as the acquire succeeds"""
+        acquire = asyncio.ensure_future(semaphore.acquire())
+        try:
+            await asyncio.wait_for(asyncio.shield(acquire), self._remaining(deadline))
+        except BaseException:
+            acquire.cancel()
+            # Runs once the acquire has settled; a permit it got after all goes back
+            acquire.add_done_callback(lambda t: t.cancelled() or semaphore.release())
+            raise
+
+    def _admit_blocking(self, model: str, deadline: float) -> threading.BoundedSemaphore:
+        """_admit for blocking calls: waits in the calling thread"""
+        with self._thread_lock:
+            semaphore = self._thread_semaphores.get(model)
+            if semaphore is None:
+                semaphore = self._thread_semaphores[model] = threading.BoundedSemaphore(self.max_concurrency)
+
+        queued_at = time.monotonic()
+        self.queued += 1
+        try:
+            if not semaphore.acquire(timeout=self._remaining(deadline)):
+                raise self._queue_timeout()
+            try:
+                wait = self._rate_wait(deadline)
+                if wait:
+                    time.sleep(wait)
+            except BaseException:
+                semaphore.release()
+                raise
+        finally:
+            self.queued -= 1
+        self._waited(model, queued_at)
+        return semaphore
+
+    def _retry_delay(self, attempt: int, error: Exception, deadline: float) -> float:
+        """Jittered delay before the next attempt; raises error when retries or time ran out"""
+        delay = random.uniform(0, self.retry_base_delay * 2 ** attempt)
+        if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+            self.failures += 1
+            raise error
+        self.retries += 1
+        print(f"LLM call failed ({type(error).__name__}), retrying in {delay:.2f}s")
+        return delay
+
+    async def _backoff(self, attempt: int, error: Exception, deadline: float):
+        await asyncio.sleep(self._retry_delay(attempt, error, deadline))
+
+    async def _call(self, model: str, messages: List, params: Dict, deadline: float, operation: str):
+        llm = self.llm_factory().bind(**params)
+        attempt = 0
+        while True:
+            semaphore = await self._admit(model, deadline)
+            self.running += 1
+            self.calls += 1
+            started_at = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await asyncio.wait_for(llm.ainvoke(messages), self._remaining(deadline))
+                outcome = "ok"
+                record_llm_call(operation, time.perf_counter() - started_at, outcome,
+                                getattr(response, "usage_metadata", None))
+                return response
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                outcome = "timeout"
+                raise LLMTimeout(f"LLM call exceeded its {self.timeout:g}s deadline")
+            except retryable_errors() as e:
+                error = e
+            finally:
+                self.running -= 1
+                semaphore.release()
+                if outcome != "ok":
+                    record_llm_call(operation, time.perf_counter() - started_at, outcome)
+            await self._backoff(attempt, error, deadline)
+            attempt += 1
+
+    def _call_blocking(self, model: str, messages: List, params: Dict, deadline: float, operation: str):
+        llm = self.llm_factory().bind(**params)
+        attempt = 0
+        while True:
+            semaphore = self._admit_blocking(model, deadline)
+            self.running += 1
+            self.calls += 1
+            started_at = time.perf_counter()
+            outcome = "error"
+            try:
+                response = llm.invoke(messages)
+                outcome = "ok"
+                record_llm_call(operation, time.perf_counter() - started_at, outcome,
+                                getattr(response, "usage_metadata", None))
+                return response
+            except retryable_errors() as e:
+                error = e
+            finally:
+                self.running -= 1
+                semaphore.release()
+                if outcome != "ok":
+                    record_llm_call(operation, time.perf_counter() - started_at, outcome)
+            time.sleep(self._retry_delay(attempt, error, deadline))
+            attempt += 1
+
+    def invoke(self, messages: List, coalesce: bool = True, operation: str = "llm", **params):
+        """Blocking version of ainvoke for the sync graph nodes, with the same limits,
+        deadline, retries and coalescing (of blocking calls)"""
+        model = params.get("model", self.default_model)
+        deadline = time.monotonic() + self.timeout
+        if not coalesce:
+            return self._call_blocking(model, messages, params, deadline, operation)
+
+        key = self.make_key(model, messages, params)
+        with self._thread_lock:
+            future = self._thread_in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._thread_in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            try:
+                return future.result(timeout=self._remaining(deadline))
+            except FutureTimeout:
+                self.timeouts += 1
+                raise LLMTimeout(f"LLM call exceeded its {self.timeout:g}s deadline")
+
+        try:
+            response = self._call_blocking(model, messages, params, deadline, operation)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._thread_lock:
+                self._thread_in_flight.pop(key, None)
+
+    async def ainvoke(self, messages: List, coalesce: bool = True, operation: str = "llm", **params):
+        """Response of the bound model for messages; params are passed to ChatOpenAI.bind.
+        operation names the call in the metrics."""
+        model = params.get("model", self.default_model)
+        deadline = time.monotonic() + self.timeout
+        if not coalesce:
+            return await self._call(model, messages, params, deadline, operation)
+
+        key = self.make_key(model, messages, params)
+        entry = self._in_flight.get(key)
+        if entry is not None and entry[0].done():
+            # Finished or cancelled, its done-callback has not run yet: start a new call
+            entry = None
+        if entry is None:
+            task = asyncio.ensure_future(self._call(model, messages, params, deadline, operation))
+            entry = self._in_flight[key] = [task, 0]
+            task.add_done_callback(lambda _, entry=entry: self._forget(key, entry))
+        else:
+            self.coalesced += 1
+
+        entry[1] += 1
+        try:
+            # shield: one caller giving up must not cancel the call for the others
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+                self._forget(key, entry)
+
+    def _forget(self, key: str, entry: list):
+        """Remove a coalescing entry, unless a newer call already took its key"""
+        if self._in_flight.get(key) is entry:
+            del self._in_flight[key]
+
+    async def astream(self, messages: List, operation: str = "llm", **params) -> AsyncIterator:
+        """Chunks of a streamed response. Streams are not coalesced, and are only retried
+        while nothing has been yielded yet."""
+        model = params.get("model", self.default_model)
+        deadline = time.monotonic() + self.timeout
+        llm = self.llm_factory().bind(**params)
+        attempt = 0
+        while True:
+            semaphore = await self._admit(model, deadline)
+            self.running += 1
+            self.calls += 1
+            started = False
+            started_at = time.perf_counter()
+            outcome = "error"
+            usage = None
+            chunks = llm.astream(messages).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self._remaining(deadline))
+                    except StopAsyncIteration:
+                        outcome = "ok"
+                        return
+                    started = True
+                    # With stream_usage the last chunk carries the token counts
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    yield chunk
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                outcome = "timeout"
+                raise LLMTimeout(f"LLM call exceeded its {self.timeout:g}s deadline")
+            except retryable_errors() as e:
+                if started:
+                    self.failures += 1
+                    raise
+                error = e
+            finally:
+                self.running -= 1
+                semaphore.release()
+                await chunks.aclose()
+                record_llm_call(operation, time.perf_counter() - started_at, outcome, usage)
+            await self._backoff(attempt, error, deadline)
+            attempt += 1
+
+    def stats(self) -> Dict:
+        waits = sorted(self.wait_seconds)
+        return {
+            "queue_depth": self.queued,
+            "running": self.running,
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0
+        }
@@ -1,21 +1,94 @@
-from langgraph_agents import create_document_workflow, DocumentState
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from langgraph_agents import get_document_workflow, DocumentState, QUESTION_MODE
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple, Union
+from contextlib import asynccontextmanager
+import aiofiles
+import asyncio
+import csv
+import hashlib
+import json
 import os
 import uuid
-import shutil
-from langgraph_agents import validation_node, question_generator_node
-from document_processor import DocumentProcessor
+from collections import OrderedDict
+from langgraph_agents import avalidation_node, avalidate_answers, agenerate_all_questions, astream_question_node
+from langgraph_agents import OPENAI_API_KEY, get_llm, llm_scheduler, local_validator, question_cache
+from document_pool import DocumentPool, DocumentPoolBusy, TemplateParseError, analyze_template, render_document
+from question_prefetcher import QuestionPrefetcher
+from session_store import create_session_store
+from batch_generation import BatchJob, batch_jobs, read_value_rows, register_batch, safe_filename, stream_batch
+from placeholder_groups import expand_keys, expand_values
+from artifact_cache import ArtifactCache
+from metrics import METRICS_ENABLED, MetricsMiddleware, current_session, register_gauge, registry, span
 
-os.makedirs("uploads", exist_ok=True)
+os.makedirs("uploads/templates", exist_ok=True)
 os.makedirs("output", exist_ok=True)
 os.makedirs("static", exist_ok=True)
 
-app = FastAPI(title="Lexsy Document Automation")
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "20"))
+# Build the workflow and LLM client and start the document workers at startup instead of
+# on the first request; /api/ready reports not ready until this has finished
+PREWARM = os.getenv("PREWARM", "0") == "1"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+TEMPLATE_ANALYSIS_CACHE = int(os.getenv("TEMPLATE_ANALYSIS_CACHE", "256"))
+# Room for the multipart boundaries and part headers around an upload of MAX_UPLOAD_MB
+UPLOAD_FRAMING_BYTES = 64 * 1024
+
+class UploadLimitMiddleware:
+    """Rejects request bodies over MAX_UPLOAD_MB before Starlette spools them to disk:
+    up front from Content-Length, or as soon as a chunked body goes over the limit"""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"File is larger than {MAX_UPLOAD_MB:g} MB"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+warm_up_task: Optional[asyncio.Task] = None
+
+async def warm_up():
+    await asyncio.to_thread(get_document_workflow)
+    await asyncio.to_thread(get_llm)
+    await document_pool.warm_up()
+    print("Warm-up finished")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the warm-up (with PREWARM) at startup, stop the document workers at shutdown"""
+    global warm_up_task
+    if PREWARM and OPENAI_API_KEY:
+        warm_up_task = asyncio.create_task(warm_up())
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    document_pool.shutdown()
+
+app = FastAPI(title="Lexsy Document Automation", lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -28,16 +101,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-sessions = {}
+# Request durations per route for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Oversized uploads are refused before they are read (store_upload checks the file itself)
+app.add_middleware(UploadLimitMiddleware, max_bytes=int(MAX_UPLOAD_MB * 1024 * 1024) + UPLOAD_FRAMING_BYTES)
+
+# Bounded, evicting session store (in-memory or SQLite shared by workers, see SESSION_STORE)
+session_store = create_session_store()
+
+# Generates question N+1 while the user answers question N
+question_prefetcher = QuestionPrefetcher()
 
-# Create LangGraph workflow
-document_workflow = create_document_workflow()
+# Parsing, filling and previews run in worker processes (see DOCUMENT_WORKERS)
+document_pool = DocumentPool()
+
+# Placeholders, groups and context snippets by template path (content addressed), so a
+# repeat upload does not parse the template again in whichever worker it lands on
+template_analyses: "OrderedDict[str, Dict]" = OrderedDict()
+
+# Filled documents and previews by (template, values), shared by all sessions (see ARTIFACT_CACHE_MB)
+artifact_cache = ArtifactCache()
+
+# Gauges read on every /metrics scrape
+register_gauge("lexsy_sessions", "Sessions in the session store", lambda: len(session_store))
+register_gauge("lexsy_llm_queue_depth", "LLM calls waiting for a slot", lambda: llm_scheduler.queued)
+register_gauge("lexsy_llm_running", "LLM calls in flight", lambda: llm_scheduler.running)
+register_gauge("lexsy_prefetch_in_flight", "Questions being prefetched", question_prefetcher.in_flight)
+register_gauge("lexsy_document_pool_pending", "Document jobs queued or running", lambda: document_pool.pending)
+register_gauge("lexsy_question_cache_entries", "Questions in the question cache", lambda: len(question_cache.entries))
+register_gauge("lexsy_artifact_cache_bytes", "Bytes of generated documents on disk", lambda: artifact_cache.total_bytes)
+
+@app.exception_handler(DocumentPoolBusy)
+async def document_pool_busy(request: Request, exc: DocumentPoolBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 class ChatMessage(BaseModel):
     session_id: str
     message: str
     placeholder: str = None
 
+class AnswersMessage(BaseModel):
+    session_id: str
+    answers: Dict[str, str]
+
 class SessionData(BaseModel):
     session_id: str
     placeholders: List[str]
@@ -50,84 +161,202 @@ async def root():
     with open("static/index.html", "r") as f:
         return HTMLResponse(content=f.read())
 
-@app.post("/api/upload")
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process document using LangGraph agents"""
+async def store_upload(file: UploadFile) -> Tuple[str, bool]:
+    """Stream the upload to disk in chunks while hashing it.
+    
+    Templates are stored once under their SHA-256, so re-uploading a byte-identical
+    file reuses the stored copy (and the analysis cached for that path). Returns the
+    template path and whether this upload created it.
+    """
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    digest = hashlib.sha256()
+    size = 0
+    part_path = f"uploads/.{uuid.uuid4()}.part"
+    
+    try:
+        with span("store_upload") as stage:
+            async with aiofiles.open(part_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise HTTPException(status_code=413, detail=f"File is larger than {MAX_UPLOAD_MB:g} MB")
+                    digest.update(chunk)
+                    await buffer.write(chunk)
+            if stage is not None:
+                stage.set(bytes=size)
+        
+        template_path = f"uploads/templates/{digest.hexdigest()}.docx"
+        if os.path.exists(template_path):
+            os.remove(part_path)
+            return template_path, False
+        os.replace(part_path, template_path)
+        return template_path, True
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+async def analyze_upload(file_path: str, created: bool) -> Dict:
+    """Parse a stored template in a worker process, which keeps it cached for later renders.
+    Results are kept by path, so uploading the same template again skips the workers."""
+    analysis = template_analyses.get(file_path)
+    if analysis is None:
+        try:
+            analysis = await document_pool.run(analyze_template, file_path)
+        except TemplateParseError:
+            # A template that was already stored may be in use by other sessions; keep it
+            if created and os.path.exists(file_path):
+                os.remove(file_path)
+            raise HTTPException(status_code=400, detail="Could not read the .docx file")
+    template_analyses[file_path] = analysis
+    template_analyses.move_to_end(file_path)
+    while len(template_analyses) > TEMPLATE_ANALYSIS_CACHE:
+        template_analyses.popitem(last=False)
+    return analysis
+
+async def prepare_upload(file: UploadFile) -> Tuple[str, DocumentState]:
+    """Store and parse an uploaded template; returns its path and the initial workflow state"""
     
     if not file.filename.endswith('.docx'):
         raise HTTPException(status_code=400, detail="Only .docx files are supported")
     
-    session_id = str(uuid.uuid4())
-    file_path = f"uploads/{session_id}_{file.filename}"
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    processor = DocumentProcessor(file_path)
-    document_text = processor.extract_text()
-    placeholders = processor.detect_placeholders()
+    file_path, created = await store_upload(file)
+    analysis = await analyze_upload(file_path, created)
+    placeholders = analysis["placeholders"]
     
     if not placeholders:
         raise HTTPException(status_code=400, detail="No placeholders found in document")
     
+    # Copies: the cached analysis is shared by every upload of the template
     initial_state: DocumentState = {
-        "document_text": document_text,
-        "placeholders": placeholders,
+        "placeholders": list(placeholders),
         "current_placeholder": "",
         "current_index": 0,
         "collected_values": {},
         "user_response": "",
         "question": "",
         "validation_result": {},
-        "messages": []
+        "questions": {},
+        "contexts": dict(analysis["contexts"]),
+        "placeholder_groups": dict(analysis["groups"])
     }
+    return file_path, initial_state
+
+def start_session(session_id: str, file_path: str, filename: str, result: DocumentState) -> Dict:
+    """Store the new session and return the upload response"""
     
-    # Run workflow to generate first question
-    result = document_workflow.invoke(initial_state)
-    
-    sessions[session_id] = {
+    session_store.put(session_id, {
         "file_path": file_path,
         "workflow_state": result,
-        "original_filename": file.filename,
-        "processor": processor
-    }
+        "original_filename": filename
+    })
+    
+    question_prefetcher.prefetch(session_id, result)
     
     current_question_number = result['current_index'] + 1
     
     return {
         "session_id": session_id,
-        "total_placeholders": len(placeholders),
+        "total_placeholders": len(result['placeholders']),
         "first_question": result['question'],
         "current_placeholder": result['current_placeholder'],
-        "progress": f"{current_question_number}/{len(placeholders)}"
+        "progress": f"{current_question_number}/{len(result['placeholders'])}"
     }
 
-@app.post("/api/chat")
-async def chat_response(chat: ChatMessage):    
-    session = sessions.get(chat.session_id)
+def sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Disable proxy buffering so every event is delivered as soon as it is sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/upload")
+async def upload_document(file: UploadFile = File(...)):
+    """Upload and process document using LangGraph agents"""
+    
+    session_id = str(uuid.uuid4())
+    current_session.set(session_id)
+    file_path, initial_state = await prepare_upload(file)
+    
+    # Ask for every question in one go so later chat steps never wait on question generation
+    if QUESTION_MODE == "batch":
+        initial_state["questions"] = await agenerate_all_questions(initial_state)
+    
+    # Run workflow to generate first question
+    result = await get_document_workflow().ainvoke(initial_state)
+    
+    return start_session(session_id, file_path, file.filename, result)
+
+@app.post("/api/upload/stream")
+async def upload_document_stream(file: UploadFile = File(...)):
+    """Streaming /api/upload: server-sent events with the first question's tokens as they arrive
+    
+    Sends `token` events ({"text": ...}), then one `question` event with the same body
+    as /api/upload. Failures after the stream started arrive as an `error` event.
+    """
+    
+    session_id = str(uuid.uuid4())
+    current_session.set(session_id)
+    file_path, initial_state = await prepare_upload(file)
+    
+    async def events():
+        current_session.set(session_id)
+        # The batch for the remaining placeholders runs while the first question streams
+        batch = None
+        if QUESTION_MODE == "batch" and len(initial_state["placeholders"]) > 1:
+            batch = asyncio.create_task(agenerate_all_questions(
+                {**initial_state, "placeholders": initial_state["placeholders"][1:]}
+            ))
+        try:
+            async for item in astream_question_node(initial_state):
+                if isinstance(item, str):
+                    yield sse_event("token", {"text": item})
+                else:
+                    result = item
+            if batch is not None:
+                result["questions"].update(await batch)
+            yield sse_event("question", start_session(session_id, file_path, file.filename, result))
+        except Exception as e:
+            print(f"Streaming upload failed: {e}")
+            yield sse_event("error", {"detail": "Could not generate the first question"})
+        finally:
+            if batch is not None and not batch.done():
+                batch.cancel()
+    
+    return sse_response(events())
+
+async def validate_answer(chat: ChatMessage):
+    """Validate the user's answer; returns the session, the validated state and, when the
+    conversation does not continue with a next question, the response to send instead"""
+    current_session.set(chat.session_id)
+    
+    session = session_store.get(chat.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
    
-    current_state = session["workflow_state"]
-    
-    # Update state with user response
-    validation_state: DocumentState = {
-        **current_state,
-        "user_response": chat.message
-    }
+    # Update state with user response (the node updates it in place)
+    validation_state: DocumentState = session["workflow_state"]
+    validation_state["user_response"] = chat.message
     
     # Run validation node
-    validated_state = validation_node(validation_state)
+    validated_state = await avalidation_node(validation_state)
     
     # Update session state
     session["workflow_state"] = validated_state
+    session_store.put(chat.session_id, session)
     
     # Check validation result
     validation_result = validated_state.get('validation_result', {})
     
     if not validation_result.get('valid', True):
-        current_position = current_state['current_index'] + 1
-        return {
+        # Placeholder is unchanged, so only a prefetch for another index is stale
+        question_prefetcher.discard_stale(chat.session_id, validated_state['current_index'] + 1)
+        current_position = validated_state['current_index'] + 1
+        return session, validated_state, {
             "type": "validation_error",
             "message": validation_result.get('feedback', 'Please provide a valid response'),
             "current_placeholder": validated_state['current_placeholder'],
@@ -137,17 +366,24 @@ async def chat_response(chat: ChatMessage):
     # Check if complete
     total_placeholders = len(validated_state['placeholders'])
     if validated_state['current_index'] >= total_placeholders:
-        return {
+        question_prefetcher.cancel(chat.session_id)
+        return session, validated_state, {
             "type": "complete",
             "message": "All information collected! Generating your document...",
             "total_collected": len(validated_state['collected_values'])
         }
     
-    # Generate next question
-    next_question_state = question_generator_node(validated_state)
+    return session, validated_state, None
+
+def next_question_response(session_id: str, session: Dict, next_question_state: DocumentState,
+                           prefetch: bool = True) -> Dict:
+    """Store the state with the next question and return the chat response"""
     
     # Update session with new state
     session["workflow_state"] = next_question_state
+    session_store.put(session_id, session)
+    if prefetch:
+        question_prefetcher.prefetch(session_id, next_question_state)
     
     current_question_number = next_question_state['current_index'] + 1
     
@@ -155,34 +391,138 @@ async def chat_response(chat: ChatMessage):
         "type": "next_question",
         "question": next_question_state['question'],
         "current_placeholder": next_question_state['current_placeholder'],
-        "progress": f"{current_question_number}/{total_placeholders}"
+        "progress": f"{current_question_number}/{len(next_question_state['placeholders'])}"
     }
 
+@app.post("/api/chat")
+async def chat_response(chat: ChatMessage):    
+    session, validated_state, response = await validate_answer(chat)
+    if response:
+        return response
+    
+    # Generate next question (usually already prefetched while the user was typing)
+    next_question_state = await question_prefetcher.next_question(chat.session_id, validated_state)
+    
+    return next_question_response(chat.session_id, session, next_question_state)
+
+@app.post("/api/chat/stream")
+async def chat_response_stream(chat: ChatMessage):
+    """Streaming /api/chat: server-sent events with the next question's tokens as they arrive
+    
+    Sends `token` events ({"text": ...}) followed by a `next_question` event, or a single
+    `validation_error` / `complete` event. Each final event has the /api/chat body.
+    """
+    
+    session, validated_state, response = await validate_answer(chat)
+    
+    async def events():
+        current_session.set(chat.session_id)
+        if response:
+            yield sse_event(response["type"], response)
+            return
+        try:
+            async for item in question_prefetcher.astream_next_question(chat.session_id, validated_state):
+                if isinstance(item, str):
+                    yield sse_event("token", {"text": item})
+                else:
+                    next_question_state = item
+            yield sse_event("next_question", next_question_response(chat.session_id, session, next_question_state))
+        except Exception as e:
+            print(f"Streaming chat failed: {e}")
+            yield sse_event("error", {"detail": "Could not generate the next question"})
+    
+    return sse_response(events())
+
+@app.post("/api/answers")
+async def submit_answers(submission: AnswersMessage):
+    """Validate many answers at once (form-style), instead of one /api/chat round trip each
+    
+    Answers are validated in one structured LLM call, or a few concurrent ones for long
+    forms. Returns per-field results, and the /api/chat `next_question` or `complete`
+    body for the first placeholder still without a value.
+    """
+    
+    current_session.set(submission.session_id)
+    session = session_store.get(submission.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if not submission.answers:
+        raise HTTPException(status_code=400, detail="No answers given")
+    
+    previous_index = session["workflow_state"]['current_index']
+    validated_state = await avalidate_answers(session["workflow_state"], submission.answers)
+    
+    results = validated_state['validation_result']['fields']
+    accepted = sum(1 for result in results.values() if result['valid'])
+    summary = {"results": results, "accepted": accepted, "rejected": len(results) - accepted}
+    
+    if validated_state['current_index'] >= len(validated_state['placeholders']):
+        question_prefetcher.cancel(submission.session_id)
+        session["workflow_state"] = validated_state
+        session_store.put(submission.session_id, session)
+        return {
+            "type": "complete",
+            "message": "All information collected! Generating your document...",
+            "total_collected": len(validated_state['collected_values']),
+            **summary
+        }
+    
+    # The current question still stands (and its prefetch) unless its placeholder was answered
+    if validated_state['current_index'] == previous_index:
+        return {**next_question_response(submission.session_id, session, validated_state, prefetch=False), **summary}
+    
+    next_question_state = await question_prefetcher.next_question(submission.session_id, validated_state)
+    return {**next_question_response(submission.session_id, session, next_question_state), **summary}
+
+def template_hash(file_path: str) -> str:
+    """SHA-256 of a stored template, which store_upload uses as its file name"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+async def render_artifact(file_path: str, values: Dict[str, str],
+                          changed_keys: Optional[List[str]] = None) -> Tuple[str, Union[str, Dict[str, str]]]:
+    """Artifact key of the filled document and its preview, or with changed_keys the
+    preview patch. Only what artifact_cache does not have yet is rendered."""
+    key = ArtifactCache.make_key(template_hash(file_path), values)
+    if changed_keys is None:
+        preview = artifact_cache.get_preview(key)
+        if preview is not None:
+            return key, preview
+    
+    part_path = None if artifact_cache.has_document(key) else artifact_cache.part_path(key)
+    try:
+        preview = await document_pool.run(render_document, file_path, values, part_path, changed_keys)
+    except BaseException:
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    artifact_cache.add(key, part_path, preview if changed_keys is None else None)
+    return key, preview
+
 @app.post("/api/generate")
 async def generate_document(session_id: str):
     """Generate final document and return preview"""
     
-    session = sessions.get(session_id)
+    current_session.set(session_id)
+    session = session_store.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
     workflow_state = session["workflow_state"]
     collected_values = workflow_state['collected_values']
+    groups = workflow_state.get("placeholder_groups", {})
     
     # Generate output
     output_filename = f"completed_{session['original_filename']}"
-    output_path = f"output/{session_id}_{output_filename}"
-    
-    # Fill template
-    processor = session["processor"]
-    processor.fill_template(collected_values, output_path)
     
-    # Generate HTML preview
-    html_preview = processor.generate_html_preview(output_path)
+    # Fill template and generate HTML preview (split into blocks that /api/update-values can patch),
+    # or reuse both when this template was already generated with these values
+    # (every variant of a grouped placeholder gets the group's value)
+    artifact, html_preview = await render_artifact(session["file_path"], expand_values(collected_values, groups))
     
-    # Store output path in session
-    session["output_path"] = output_path
+    # Store the generated document's artifact key in session
+    session["artifact"] = artifact
     session["output_filename"] = output_filename
+    session_store.put(session_id, session)
     
     return {
         "preview_html": html_preview,
@@ -191,10 +531,15 @@ async def generate_document(session_id: str):
     }
 
 @app.post("/api/update-values")
-async def update_values(session_id: str, updated_values: Dict[str, str]):
-    """Update placeholder values and regenerate document"""
+async def update_values(session_id: str, updated_values: Dict[str, str], incremental: bool = False):
+    """Update placeholder values and regenerate document
     
-    session = sessions.get(session_id)
+    With incremental=true only the preview blocks that contain a changed placeholder
+    are re-rendered and returned as preview_patch: element id -> new inner HTML.
+    """
+    
+    current_session.set(session_id)
+    session = session_store.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -204,46 +549,155 @@ async def update_values(session_id: str, updated_values: Dict[str, str]):
         raise HTTPException(status_code=500, detail="Workflow state not found")
     
     # Update collected values in the workflow state
+    changed_keys = [
+        key for key, value in updated_values.items()
+        if workflow_state["collected_values"].get(key) != value
+    ]
     workflow_state["collected_values"].update(updated_values)
     session["workflow_state"] = workflow_state
+    session_store.put(session_id, session)
+    
+    # Regenerate document with ALL collected values, always from the original template;
+    # re-render only the preview blocks that changed, or the whole preview
+    groups = workflow_state.get("placeholder_groups", {})
+    artifact, preview = await render_artifact(
+        session["file_path"], expand_values(workflow_state["collected_values"], groups),
+        expand_keys(changed_keys, groups) if incremental else None
+    )
+    session["artifact"] = artifact
+    session_store.put(session_id, session)
     
-    # Ensures start from the original template, not a modified version
-    original_file_path = session["file_path"]
-    processor = DocumentProcessor(original_file_path)
+    response = {
+        "collected_values": workflow_state["collected_values"],
+        "message": "Document updated successfully"
+    }
+    if incremental:
+        response["preview_patch"] = preview
+    else:
+        response["preview_html"] = preview
     
-    # Regenerate document with updated values
-    output_path = session["output_path"]
+    return response
+
+@app.post("/api/batch-generate")
+async def batch_generate(template: UploadFile = File(...), values: UploadFile = File(...),
+                         name_column: Optional[str] = None):
+    """Fill one template with every row of a CSV/JSONL file and stream the documents as a ZIP
+    
+    Documents are added to the archive as they finish; report.json at the end lists
+    per-row errors. Progress is available from /api/batch-generate/{batch_id}, with the
+    id sent in the X-Batch-Id header.
+    """
     
-    # Fill template with ALL collected values
-    processor.fill_template(workflow_state["collected_values"], output_path)
+    if not template.filename.endswith('.docx'):
+        raise HTTPException(status_code=400, detail="Only .docx files are supported")
     
-    # Generate new preview from the newly created document
-    html_preview = processor.generate_html_preview(output_path)
+    try:
+        rows = read_value_rows(values.file, values.filename)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read the values file: {e}")
+    if not rows:
+        raise HTTPException(status_code=400, detail="The values file has no rows")
+    
+    file_path, created = await store_upload(template)
+    analysis = await analyze_upload(file_path, created)
+    
+    job = BatchJob(total=len(rows))
+    register_batch(job)
+    stem = safe_filename(os.path.splitext(os.path.basename(template.filename))[0]) or "document"
+    
+    return StreamingResponse(
+        stream_batch(document_pool, job, file_path, analysis["placeholders"], rows, stem, name_column,
+                     groups=analysis["groups"]),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="completed_{stem}.zip"',
+            "X-Batch-Id": job.batch_id
+        }
+    )
+
+@app.get("/api/batch-generate/{batch_id}")
+async def batch_progress(batch_id: str):
+    """Progress and per-row errors of a batch started on this worker"""
+    
+    job = batch_jobs.get(batch_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return job.to_dict()
+
+@app.get("/api/ready")
+async def ready():
+    """Readiness for load balancers: 503 until the API key is set and any warm-up has finished"""
+    
+    if not OPENAI_API_KEY:
+        return JSONResponse(status_code=503, content={"ready": False, "detail": "OPENAI_API_KEY is not set"})
+    if warm_up_task is not None:
+        if not warm_up_task.done():
+            return JSONResponse(status_code=503, content={"ready": False, "detail": "Warming up"})
+        if warm_up_task.exception() is not None:
+            return JSONResponse(status_code=503, content={"ready": False, "detail": f"Warm-up failed: {warm_up_task.exception()}"})
+    return {"ready": True}
+
+@app.get("/api/stats")
+async def stats():
+    """Counters of this worker: LLM queue and calls, caches, document pool, sessions"""
     
     return {
-        "preview_html": html_preview,
-        "collected_values": workflow_state["collected_values"],
-        "message": "Document updated successfully"
+        "llm": llm_scheduler.stats(),
+        "question_cache": question_cache.stats(),
+        "local_validation": local_validator.stats(),
+        "prefetch": {
+            "in_flight": question_prefetcher.in_flight(),
+            "hits": question_prefetcher.hits,
+            "misses": question_prefetcher.misses
+        },
+        "document_pool": document_pool.stats(),
+        "artifact_cache": artifact_cache.stats(),
+        "sessions": len(session_store)
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics of this worker: stage and request latencies, LLM calls and tokens, gauges"""
+    
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/download/{session_id}")
-async def download_document(session_id: str):
-    """Download complete document"""
+async def download_document(session_id: str, request: Request):
+    """Download complete document
     
-    session = sessions.get(session_id)
+    The ETag is the artifact key, so a client holding the current version gets a 304
+    for If-None-Match; Range requests are answered with partial content.
+    """
+    
+    current_session.set(session_id)
+    session = session_store.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    output_filename = f"completed_{session['original_filename']}"
-    output_path = f"output/{session_id}_{output_filename}"
-    
-    if not os.path.exists(output_path):
+    artifact = session.get("artifact")
+    if artifact is None:
         raise HTTPException(status_code=404, detail="Generated document not found")
     
+    if not artifact_cache.has_document(artifact):
+        # Evicted since it was generated: fill it again (no preview is needed)
+        workflow_state = session["workflow_state"]
+        values = expand_values(workflow_state["collected_values"], workflow_state.get("placeholder_groups", {}))
+        artifact, _ = await render_artifact(session["file_path"], values, changed_keys=[])
+    
+    etag = f'"{artifact}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    
+    output_filename = f"completed_{session['original_filename']}"
     return FileResponse(
-        path=output_path,
+        path=artifact_cache.document_path(artifact),
         filename=output_filename,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        headers=headers
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,239 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# With metrics off, span() returns a shared no-op context manager and nothing is recorded
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Print every finished span as one JSON line (stage, duration, session, attributes)
+SPAN_LOG = os.getenv("SPAN_LOG", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NOOP = nullcontext()
+
+# Session the current request works on; asyncio tasks inherit it, so spans in the
+# agents and the prefetcher are attributed without passing the id around
+current_session: contextvars.ContextVar[str] = contextvars.ContextVar("current_session", default="")
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {value:g}" for key, value in self.values.items()]
+
+class Gauge(Metric):
+    """Gauge read from a callback when /metrics is scraped"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {float(self.read()):g}"]
+        except Exception as e:
+            print(f"Could not read gauge {self.name}: {e}")
+            return []
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.values: Dict[Tuple, list] = {}   # labels -> [per-bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "lexsy_stage_seconds", "Time spent in each processing stage", ["stage"]
+))
+LLM_CALL_SECONDS = registry.register(Histogram(
+    "lexsy_llm_call_seconds", "Duration of LLM requests", ["operation", "outcome"]
+))
+LLM_QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "lexsy_llm_queue_wait_seconds", "Time LLM calls waited for a concurrency slot and a rate token", ["model"]
+))
+LLM_TOKENS = registry.register(Counter(
+    "lexsy_llm_tokens_total", "LLM tokens used", ["operation", "kind"]
+))
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "lexsy_http_request_seconds", "HTTP request duration until the response starts", ["method", "route", "status"]
+))
+
+def register_gauge(name: str, help: str, read: Callable[[], float]):
+    registry.register(Gauge(name, help, read))
+
+class Span:
+    """Timing of one stage; attributes (token usage, sizes, ...) can be added while it runs"""
+
+    __slots__ = ("stage", "attributes", "start")
+
+    def __init__(self, stage: str, attributes: Dict):
+        self.stage = stage
+        self.attributes = attributes
+        self.start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+# Spans finished inside a document worker are collected here and sent back to the
+# API process with the job result (see document_pool.run_job)
+_collector = threading.local()
+
+def record_span(stage: str, seconds: float, attributes: Dict):
+    """Record a finished span: stage histogram, and the span log when enabled"""
+    collected = getattr(_collector, "spans", None)
+    if collected is not None:
+        collected.append((stage, seconds, attributes))
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if SPAN_LOG:
+        session_id = attributes.pop("session_id", None) or current_session.get()
+        print(json.dumps({"span": stage, "ms": round(seconds * 1000, 2), "session_id": session_id, **attributes}))
+
+@contextmanager
+def _span(stage: str, attributes: Dict):
+    span = Span(stage, attributes)
+    try:
+        yield span
+    finally:
+        record_span(stage, time.perf_counter() - span.start, span.attributes)
+
+def span(stage: str, **attributes):
+    """Time a stage: `with span("parse_docx"):`. A no-op when metrics are disabled."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _span(stage, attributes)
+
+@contextmanager
+def collect_spans():
+    """Collect the spans this thread finishes in the block instead of recording them"""
+    previous = getattr(_collector, "spans", None)
+    _collector.spans = collected = []
+    try:
+        yield collected
+    finally:
+        _collector.spans = previous
+
+def record_llm_call(operation: str, seconds: float, outcome: str, usage: Optional[Dict] = None):
+    if not METRICS_ENABLED:
+        return
+    LLM_CALL_SECONDS.observe(seconds, operation=operation, outcome=outcome)
+    attributes = {"operation": operation, "outcome": outcome}
+    if usage:
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), operation=operation, kind="prompt")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), operation=operation, kind="completion")
+        attributes.update(prompt_tokens=usage.get("input_tokens", 0), completion_tokens=usage.get("output_tokens", 0))
+    record_span("llm", seconds, attributes)
+
+def record_llm_queue_wait(model: str, seconds: float):
+    if METRICS_ENABLED:
+        LLM_QUEUE_WAIT_SECONDS.observe(seconds, model=model)
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by method, route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Route templates, not raw paths, so session ids do not become label values
+                route = scope.get("route")
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start, method=scope["method"],
+                    route=getattr(route, "path", "unmatched"), status=status
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_status)
@@ -0,0 +1,76 @@
+import difflib
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Also merge keys whose normalized forms are at least this similar (difflib ratio, 0-1);
+# 0 only merges keys that normalize to the same form
+PLACEHOLDER_FUZZY_THRESHOLD = float(os.getenv("PLACEHOLDER_FUZZY_THRESHOLD", "0"))
+
+def normalize_placeholder(key: str) -> str:
+    """Case, spaces and separators removed: {Company Name}, [COMPANY NAME], ___COMPANY_NAME___
+    and {{company_name}} all become company_name"""
+    return re.sub(r"[^0-9a-z]+", "_", key.lower()).strip("_")
+
+def similarity(a: str, b: str) -> float:
+    """Similarity of two normalized keys; keys with different numbers (party_1 / party_2) never match"""
+    if re.findall(r"\d+", a) != re.findall(r"\d+", b):
+        return 0.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+def group_placeholders(placeholders: List[str], counts: Optional[Dict[str, int]] = None,
+                       fuzzy_threshold: float = PLACEHOLDER_FUZZY_THRESHOLD) -> Dict[str, List[str]]:
+    """Group placeholder variants that stand for the same value.
+
+    Returns canonical key -> variants (the canonical key included), sorted by canonical
+    key. The canonical key is the variant with the most occurrences in counts, the
+    first one on a tie, so questions show a spelling the document actually uses.
+    """
+    clusters: List[List] = []       # [normalized key, variants]
+    by_normalized: Dict[str, List] = {}
+    for placeholder in placeholders:
+        normalized = normalize_placeholder(placeholder) or placeholder
+        cluster = by_normalized.get(normalized)
+        if cluster is None and fuzzy_threshold > 0:
+            scored = [(similarity(normalized, c[0]), c) for c in clusters]
+            score, best = max(scored, key=lambda s: s[0], default=(0.0, None))
+            if score >= fuzzy_threshold:
+                cluster = best
+                print(f"Grouped placeholder {placeholder!r} with {best[1][0]!r} (similarity {score:.2f})")
+        if cluster is None:
+            cluster = [normalized, []]
+            clusters.append(cluster)
+        by_normalized[normalized] = cluster
+        cluster[1].append(placeholder)
+
+    counts = counts or {}
+    groups = {}
+    for _, variants in clusters:
+        canonical = max(variants, key=lambda v: (counts.get(v, 0), -variants.index(v)))
+        groups[canonical] = [canonical] + [v for v in variants if v != canonical]
+    return dict(sorted(groups.items()))
+
+def expand_values(values: Dict[str, str], groups: Dict[str, List[str]]) -> Dict[str, str]:
+    """values with each group's value copied to all of its variants, for filling.
+    A value given for a variant itself is kept."""
+    if not groups:
+        return values
+    expanded = dict(values)
+    for canonical, variants in groups.items():
+        value = values.get(canonical)
+        if value is None:
+            value = next((values[v] for v in variants if v in values), None)
+        if value is None:
+            continue
+        for variant in variants:
+            if variant not in values:
+                expanded[variant] = value
+    return expanded
+
+def expand_keys(keys: Iterable[str], groups: Dict[str, List[str]]) -> List[str]:
+    """keys plus the variants of the groups they belong to; a key may be any variant"""
+    canonical_of = {variant: canonical for canonical, variants in groups.items() for variant in variants}
+    expanded = []
+    for key in keys:
+        expanded.extend(groups.get(canonical_of.get(key, key), [key]))
+    return list(dict.fromkeys(expanded))
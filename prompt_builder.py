@@ -0,0 +1,163 @@
+import os
+import re
+from bisect import bisect_right
+from typing import Callable, Dict, List, Tuple
+
+# Context tokens kept for one placeholder, and for all placeholders of one LLM call
+PROMPT_SNIPPET_TOKENS = int(os.getenv("PROMPT_SNIPPET_TOKENS", "120"))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+# About this many characters are taken on each side of an occurrence
+SNIPPET_WINDOW_CHARS = 200
+# Between the excerpts of one snippet
+SNIPPET_SEPARATOR = "\n...\n"
+
+# tiktoken encoding for exact counts, e.g. o200k_base; unset, tokens are estimated. tiktoken
+# downloads an encoding on first use, so pre-fetch it into TIKTOKEN_CACHE_DIR when setting this.
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "")
+
+_count_tokens: Callable[[str], int] = None
+
+def count_tokens(text: str) -> int:
+    """Tokens of text with tiktoken when TOKEN_ENCODING is set, otherwise (or when the
+    encoding cannot be loaded) about four characters per token"""
+    global _count_tokens
+    if _count_tokens is None and not TOKEN_ENCODING:
+        _count_tokens = lambda t: (len(t) + 3) // 4
+    elif _count_tokens is None:
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+            _count_tokens = lambda t: len(encoding.encode(t, disallowed_special=()))
+        except Exception as e:
+            print(f"Token counts are estimated, tiktoken is unavailable: {e.__class__.__name__}")
+            _count_tokens = lambda t: (len(t) + 3) // 4
+    return _count_tokens(text)
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break (paragraph, cell)
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n")
+
+def _clean(text: str) -> str:
+    return " ".join(text.split())
+
+def sentence_bounds(text: str) -> List[int]:
+    """Offsets where sentences start, followed by len(text): sentence i is bounds[i]:bounds[i + 1]"""
+    return [0] + [m.end() for m in SENTENCE_BREAK.finditer(text)] + [len(text)]
+
+def _sentence_window(bounds: List[int], sentence: int, chars: int) -> Tuple[int, int]:
+    """Sentences around `sentence`, alternately adding the next and the previous one
+    while the window stays within 2 * chars"""
+    first = last = sentence
+    while True:
+        grown = False
+        if last + 2 < len(bounds) and bounds[last + 2] - bounds[first] <= 2 * chars:
+            last += 1
+            grown = True
+        if first > 0 and bounds[last + 1] - bounds[first - 1] <= 2 * chars:
+            first -= 1
+            grown = True
+        if not grown:
+            return first, last
+
+def _char_window(text: str, start: int, end: int, chars: int) -> str:
+    """Whole words within chars of the occurrence, for sentences too long to send whole"""
+    left = max(0, start - chars)
+    right = min(len(text), end + chars)
+    if left > 0:
+        space = re.search(r"\s", text[left:start])
+        left = left + space.start() + 1 if space else start
+    if right < len(text):
+        space = max(text.rfind(" ", end, right), text.rfind("\n", end, right))
+        right = space if space >= end else end
+    return _clean(text[left:right])
+
+def build_snippet(text: str, bounds: List[int], spans: List[Tuple[int, int]],
+                  max_tokens: int = PROMPT_SNIPPET_TOKENS) -> str:
+    """Context for one placeholder from the (start, end) offsets of its occurrences.
+
+    Each occurrence gets the whole sentences around it. Windows that overlap or touch
+    are merged, the same clause repeated elsewhere (boilerplate) is kept once, and
+    excerpts are added in document order while they fit max_tokens. Windows depend
+    only on the sentence, so placeholders in the same clause share the same excerpt.
+    """
+    windows = []
+    for start, end in sorted(spans):
+        sentence = bisect_right(bounds, start) - 1
+        first, last = _sentence_window(bounds, sentence, SNIPPET_WINDOW_CHARS)
+        if windows and first <= windows[-1][1] + 1:
+            windows[-1][1] = max(windows[-1][1], last)
+        else:
+            windows.append([first, last, start, end])
+
+    excerpts = []
+    seen = set()
+    used = 0
+    for first, last, start, end in windows:
+        excerpt = _clean(text[bounds[first]:bounds[last + 1]])
+        if excerpt in seen:
+            continue
+        seen.add(excerpt)
+        tokens = count_tokens(excerpt)
+        if not excerpts:
+            chars = SNIPPET_WINDOW_CHARS
+            while tokens > max_tokens and chars > 0:
+                chars //= 2
+                excerpt = _char_window(text, start, end, chars)
+                tokens = count_tokens(excerpt)
+        elif used + tokens > max_tokens:
+            break
+        excerpts.append(excerpt)
+        used += tokens
+    return SNIPPET_SEPARATOR.join(excerpts)
+
+def build_snippets(index, placeholders: List[str], groups: Dict[str, List[str]] = None,
+                   max_tokens: int = PROMPT_SNIPPET_TOKENS) -> Dict[str, str]:
+    """Snippet of every placeholder from a document_processor.PlaceholderIndex; a grouped
+    placeholder gets the occurrences of all its variants"""
+    groups = groups or {}
+    bounds = sentence_bounds(index.text)
+    snippets = {}
+    for p in placeholders:
+        spans = [
+            (o.start, o.end)
+            for variant in groups.get(p, [p])
+            for o in index.occurrences.get(variant, [])
+        ]
+        snippets[p] = build_snippet(index.text, bounds, spans, max_tokens)
+    return snippets
+
+def plan_batches(placeholders: List[str], snippets: Dict[str, str], max_size: int,
+                 budget: int = PROMPT_TOKEN_BUDGET) -> List[List[str]]:
+    """Split placeholders into calls of at most max_size placeholders whose distinct
+    excerpts stay within budget tokens. A placeholder over budget on its own gets its own call."""
+    batches = []
+    batch, excerpts, used = [], set(), 0
+    for p in placeholders:
+        new = [e for e in dict.fromkeys(snippets.get(p, "").split(SNIPPET_SEPARATOR)) if e and e not in excerpts]
+        tokens = sum(count_tokens(e) for e in new)
+        if batch and (len(batch) >= max_size or used + tokens > budget):
+            batches.append(batch)
+            batch, excerpts, used = [], set(), 0
+            new = [e for e in dict.fromkeys(snippets.get(p, "").split(SNIPPET_SEPARATOR)) if e]
+            tokens = sum(count_tokens(e) for e in new)
+        batch.append(p)
+        excerpts.update(new)
+        used += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def batch_context(placeholders: List[str], snippets: Dict[str, str]) -> str:
+    """Numbered excerpts, each shared clause once, and which excerpts belong to each placeholder"""
+    numbers: Dict[str, int] = {}
+    lines = []
+    for p in placeholders:
+        refs = []
+        for excerpt in snippets.get(p, "").split(SNIPPET_SEPARATOR):
+            if not excerpt:
+                continue
+            if excerpt not in numbers:
+                numbers[excerpt] = len(numbers) + 1
+            refs.append(str(numbers[excerpt]))
+        lines.append(f"- Placeholder: {p} (excerpts {', '.join(refs) or 'none'})")
+    excerpts = "\n".join(f"[{n}] {excerpt}" for excerpt, n in numbers.items())
+    return f"Document excerpts:\n{excerpts}\n\nPlaceholders:\n" + "\n".join(lines)
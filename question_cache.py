@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+class QuestionCache:
+    """Cache of generated questions shared across sessions.
+    
+    Keys combine the normalized placeholder, a hash of its context window and the
+    prompt version, so the same placeholder in the same template text is only phrased
+    by the LLM once. Entries live in an in-memory LRU with a TTL and, when db_path is
+    set, in a SQLite file that survives restarts and is shared by all workers on a host.
+    The file keeps at most max_db_entries rows, the most recently written ones.
+    """
+    
+    # Expired / excess rows are purged every this many writes
+    PURGE_EVERY = 100
+    
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 7 * 24 * 3600, db_path: str = None,
+                 max_db_entries: int = 100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_db_entries = max_db_entries
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()       # in-memory entries, never held during SQLite I/O
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+    
+    @staticmethod
+    def make_key(placeholder: str, context: str, prompt_version: str) -> str:
+        normalized = re.sub(r'[\s_]+', '_', placeholder.strip().lower())
+        context_hash = hashlib.sha256(" ".join(context.split()).encode()).hexdigest()
+        return f"{prompt_version}:{normalized}:{context_hash}"
+    
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS question_cache "
+                "(key TEXT PRIMARY KEY, question TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS question_cache_created_at ON question_cache (created_at)")
+            self._db.commit()
+        return self._db
+    
+    def _expired(self, created_at: float) -> bool:
+        return bool(self.ttl_seconds) and time.time() - created_at > self.ttl_seconds
+    
+    def _remember(self, key: str, question: str, created_at: float):
+        self.entries[key] = (question, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def _lookup(self, key: str) -> Optional[str]:
+        """Question from the in-memory LRU; counts only hits"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and not self._expired(entry[1]):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self.entries[key]
+            return None
+    
+    def _read(self, keys: List[str]) -> Dict[str, Tuple[str, float]]:
+        """(question, created_at) of the keys found in the SQLite file"""
+        with self._db_lock:
+            db = self._connection()
+            rows = {}
+            for key in keys:
+                row = db.execute("SELECT question, created_at FROM question_cache WHERE key = ?", (key,)).fetchone()
+                if row and not self._expired(row[1]):
+                    rows[key] = row
+            return rows
+    
+    def _found(self, keys: List[str], rows: Dict[str, Tuple[str, float]]) -> Dict[str, str]:
+        with self._lock:
+            for key, (question, created_at) in rows.items():
+                self._remember(key, question, created_at)
+            self.hits += len(rows)
+            self.misses += len(keys) - len(rows)
+        return {key: row[0] for key, row in rows.items()}
+    
+    def _write(self, questions: Dict[str, str], created_at: float):
+        with self._db_lock:
+            db = self._connection()
+            for key, question in questions.items():
+                db.execute(
+                    "INSERT OR REPLACE INTO question_cache (key, question, created_at) VALUES (?, ?, ?)",
+                    (key, question, created_at)
+                )
+                self._writes += 1
+                if self._writes % self.PURGE_EVERY == 0:
+                    self._purge(db)
+            db.commit()
+    
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+    
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found = {key: question for key in keys if (question := self._lookup(key)) is not None}
+        missing = [key for key in keys if key not in found]
+        rows = self._read(missing) if self.db_path and missing else {}
+        return {**found, **self._found(missing, rows)}
+    
+    async def aget_many(self, keys: List[str]) -> Dict[str, str]:
+        """get_many for async code: the SQLite file is read in a thread, off the event loop"""
+        found = {key: question for key in keys if (question := self._lookup(key)) is not None}
+        missing = [key for key in keys if key not in found]
+        rows = await asyncio.to_thread(self._read, missing) if self.db_path and missing else {}
+        return {**found, **self._found(missing, rows)}
+    
+    async def aget(self, key: str) -> Optional[str]:
+        return (await self.aget_many([key])).get(key)
+    
+    def _remember_all(self, questions: Dict[str, str], created_at: float):
+        with self._lock:
+            for key, question in questions.items():
+                self._remember(key, question, created_at)
+    
+    def set(self, key: str, question: str):
+        self.set_many({key: question})
+    
+    def set_many(self, questions: Dict[str, str]):
+        created_at = time.time()
+        self._remember_all(questions, created_at)
+        if self.db_path and questions:
+            self._write(questions, created_at)
+    
+    async def aset_many(self, questions: Dict[str, str]):
+        """set_many for async code: the SQLite file is written in a thread, off the event loop"""
+        created_at = time.time()
+        self._remember_all(questions, created_at)
+        if self.db_path and questions:
+            await asyncio.to_thread(self._write, questions, created_at)
+    
+    def _purge(self, db: sqlite3.Connection):
+        if self.ttl_seconds:
+            db.execute("DELETE FROM question_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        db.execute(
+            "DELETE FROM question_cache WHERE key IN (SELECT key FROM question_cache "
+            "ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.max_db_entries,)
+        )
+    
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
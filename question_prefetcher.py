@@ -0,0 +1,113 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import AsyncIterator, Tuple, Union
+from langgraph_agents import aquestion_generator_node, astream_question_node, DocumentState
+
+PREFETCH_MAX_IN_FLIGHT = int(os.getenv("PREFETCH_MAX_IN_FLIGHT", "16"))
+PREFETCH_MAX_SESSIONS = int(os.getenv("PREFETCH_MAX_SESSIONS", "1000"))
+
+class QuestionPrefetcher:
+    """Generate the next question in the background while the user answers the current one.
+    
+    At most one prefetch is kept per session, keyed by the placeholder index it was
+    generated for. When the worker already has max_in_flight prefetches running, new
+    ones are skipped and the question is generated inline as before. Failed prefetches
+    are dropped when they finish; finished ones wait for their session, but only for the
+    max_sessions most recent sessions.
+    """
+    
+    def __init__(self, max_in_flight: int = PREFETCH_MAX_IN_FLIGHT, max_sessions: int = PREFETCH_MAX_SESSIONS):
+        self.max_in_flight = max_in_flight
+        self.max_sessions = max_sessions
+        self.tasks: "OrderedDict[str, Tuple[int, asyncio.Task]]" = OrderedDict()
+        self.running = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def in_flight(self) -> int:
+        return self.running
+    
+    def _finished(self, session_id: str, task: asyncio.Task):
+        self.running -= 1
+        # Retrieving the exception also keeps unused tasks from logging "exception was never retrieved"
+        if task.cancelled() or task.exception() is not None:
+            entry = self.tasks.get(session_id)
+            if entry and entry[1] is task:
+                del self.tasks[session_id]
+    
+    def prefetch(self, session_id: str, state: DocumentState):
+        """Start generating the question after state['current_index']"""
+        self.cancel(session_id)
+        
+        next_index = state['current_index'] + 1
+        if next_index >= len(state['placeholders']):
+            return
+        if state.get('questions', {}).get(state['placeholders'][next_index]):
+            return
+        if self.in_flight() >= self.max_in_flight:
+            return
+        
+        task = asyncio.create_task(aquestion_generator_node({**state, "current_index": next_index}))
+        self.running += 1
+        task.add_done_callback(lambda t: self._finished(session_id, t))
+        self.tasks[session_id] = (next_index, task)
+        # Prefetches of sessions that never came back, oldest first
+        while len(self.tasks) > self.max_sessions:
+            _, (_, oldest) = self.tasks.popitem(last=False)
+            oldest.cancel()
+    
+    async def next_question(self, session_id: str, state: DocumentState) -> DocumentState:
+        """Return state with the question for state['current_index'], using the prefetch when ready"""
+        entry = self.tasks.pop(session_id, None)
+        
+        if entry and entry[0] == state['current_index'] and not entry[1].cancelled():
+            try:
+                generated = await entry[1]
+                self.hits += 1
+                state['question'] = generated['question']
+                state['current_placeholder'] = generated['current_placeholder']
+                return state
+            except asyncio.CancelledError:
+                # Only a cancelled prefetch falls through; a cancelled request stops here
+                if not entry[1].cancelled():
+                    raise
+            except Exception as e:
+                print(f"Prefetched question failed, generating inline: {e}")
+        elif entry:
+            entry[1].cancel()
+        
+        if not state.get('questions', {}).get(state['placeholders'][state['current_index']]):
+            self.misses += 1
+        return await aquestion_generator_node(state)
+    
+    async def astream_next_question(self, session_id: str,
+                                    state: DocumentState) -> AsyncIterator[Union[str, DocumentState]]:
+        """Streaming version of next_question, same items as astream_question_node.
+        
+        A matching prefetch is awaited and yielded as one chunk; without one the
+        question is streamed from the LLM as it is generated.
+        """
+        entry = self.tasks.get(session_id)
+        if entry and entry[0] == state['current_index']:
+            next_state = await self.next_question(session_id, state)
+            yield next_state['question']
+            yield next_state
+            return
+        
+        self.cancel(session_id)
+        if not state.get('questions', {}).get(state['placeholders'][state['current_index']]):
+            self.misses += 1
+        async for item in astream_question_node(state):
+            yield item
+    
+    def discard_stale(self, session_id: str, index: int):
+        """Cancel the session's prefetch unless it was generated for index"""
+        entry = self.tasks.get(session_id)
+        if entry and entry[0] != index:
+            self.cancel(session_id)
+    
+    def cancel(self, session_id: str):
+        entry = self.tasks.pop(session_id, None)
+        if entry:
+            entry[1].cancel()
@@ -0,0 +1,377 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+import ormsgpack
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256"))
+
+# A session snapshot is SNAPSHOT_MAGIC, the format version, the SHA-256 of its static
+# segment (all zeros without one) and the msgpack body with everything else. The static
+# segment is the same for every session of a template and is stored once, by the store.
+SNAPSHOT_MAGIC = b"LXS"
+SNAPSHOT_VERSION = 2
+NO_SEGMENT = bytes(32)
+# Static segments larger than this are zlib-compressed; most of one is context snippets
+SNAPSHOT_COMPRESS_BYTES = int(os.getenv("SNAPSHOT_COMPRESS_BYTES", "1024"))
+SNAPSHOT_SEGMENT_CACHE = 256
+
+# DocumentState fields that are fixed once the session is created, stored in the static segment
+STATIC_FIELDS = ("placeholders", "questions", "contexts", "placeholder_groups")
+
+class SegmentCache:
+    """Static segments, most recent first: encoded by their packed bytes, packed bytes by
+    digest. The static fields do not change between turns and are shared by sessions of
+    the same template, so each segment is hashed, compressed and loaded once, not on every turn."""
+
+    def __init__(self, max_entries: int = SNAPSHOT_SEGMENT_CACHE):
+        self.max_entries = max_entries
+        self.encoded: "OrderedDict[bytes, Tuple[bytes, bytes]]" = OrderedDict()
+        self.decoded: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: bytes, value, max_entries: int):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+
+    def encode(self, raw: bytes) -> Tuple[bytes, bytes]:
+        """(digest, segment) of packed static fields"""
+        with self._lock:
+            entry = self.encoded.get(raw)
+        if entry is None:
+            digest = hashlib.sha256(raw).digest()
+            segment = b"\x01" + zlib.compress(raw) if len(raw) > SNAPSHOT_COMPRESS_BYTES else b"\x00" + raw
+            entry = (digest, segment)
+            with self._lock:
+                self._remember(self.encoded, raw, entry, self.max_entries)
+                self._remember(self.decoded, digest, raw, self.max_entries)
+        return entry
+
+    def decode(self, digest: bytes, load: Callable[[bytes], Optional[bytes]]) -> bytes:
+        """Packed static fields of a digest, from load(digest) (the store) when not cached"""
+        with self._lock:
+            raw = self.decoded.get(digest)
+        if raw is None:
+            segment = load(digest)
+            if segment is None:
+                raise KeyError(f"Static session segment {digest.hex()} is missing")
+            raw = _decode_segment(segment)
+            with self._lock:
+                self._remember(self.decoded, digest, raw, self.max_entries)
+        return raw
+
+def _decode_segment(segment: bytes) -> bytes:
+    return zlib.decompress(segment[1:]) if segment[0] == 1 else segment[1:]
+
+segment_cache = SegmentCache()
+
+def pack_state(state: Dict) -> Tuple[Dict, Dict]:
+    """Compact form of a DocumentState as (static, dynamic) parts: each placeholder name
+    is stored once and the other fields refer to placeholders by their index"""
+    placeholders = state.get("placeholders") or []
+    ids = {p: i for i, p in enumerate(placeholders)}
+
+    def by_index(values: Dict) -> list:
+        return [values.get(p) for p in placeholders]
+
+    def extra(values: Dict) -> Dict:
+        # Keys that are not placeholders (e.g. a variant set through /api/update-values)
+        return {key: value for key, value in values.items() if key not in ids}
+
+    questions = state.get("questions") or {}
+    contexts = state.get("contexts") or {}
+    static = {
+        "placeholders": placeholders,
+        "questions": by_index(questions),
+        "questions_extra": extra(questions),
+        "contexts": by_index(contexts),
+        "placeholder_groups": [
+            [ids.get(key, key), variants] for key, variants in (state.get("placeholder_groups") or {}).items()
+        ]
+    }
+    values = state.get("collected_values") or {}
+    current = state.get("current_placeholder", "")
+    dynamic = {key: value for key, value in state.items() if key not in STATIC_FIELDS and key != "messages"}
+    dynamic.update(
+        collected_values=by_index(values),
+        collected_values_extra=extra(values),
+        current_placeholder=ids.get(current, current)
+    )
+    return static, dynamic
+
+def unpack_state(static: Dict, dynamic: Dict) -> Dict:
+    placeholders = static["placeholders"]
+
+    def name(ref):
+        return placeholders[ref] if isinstance(ref, int) else ref
+
+    def by_name(values: list, extra: Dict) -> Dict:
+        restored = {p: value for p, value in zip(placeholders, values) if value is not None}
+        restored.update(extra)
+        return restored
+
+    state = {key: value for key, value in dynamic.items() if key != "collected_values_extra"}
+    state.update(
+        placeholders=placeholders,
+        questions=by_name(static["questions"], static["questions_extra"]),
+        contexts=by_name(static["contexts"], {}),
+        placeholder_groups={name(ref): variants for ref, variants in static["placeholder_groups"]},
+        collected_values=by_name(dynamic["collected_values"], dynamic["collected_values_extra"]),
+        current_placeholder=name(dynamic["current_placeholder"])
+    )
+    return state
+
+def serialize_session(session: Dict) -> Tuple[bytes, Optional[bytes], Optional[bytes]]:
+    """Versioned snapshot of a session as (blob, digest, segment): no message history, the
+    workflow state in its packed form, msgpack encoded. The blob only refers to the static
+    segment by digest; the store keeps the segment itself once."""
+    data = dict(session)
+    digest = segment = None
+    if data.get("workflow_state") is not None:
+        static, data["workflow_state"] = pack_state(data["workflow_state"])
+        digest, segment = segment_cache.encode(ormsgpack.packb(static))
+    return (SNAPSHOT_MAGIC + bytes((SNAPSHOT_VERSION,)) + (digest or NO_SEGMENT)
+            + ormsgpack.packb(data), digest, segment)
+
+def segment_digest(blob: bytes) -> Optional[bytes]:
+    """Digest of the static segment a snapshot refers to, if any"""
+    if not blob.startswith(SNAPSHOT_MAGIC) or blob[len(SNAPSHOT_MAGIC)] != SNAPSHOT_VERSION:
+        return None
+    offset = len(SNAPSHOT_MAGIC) + 1
+    digest = blob[offset:offset + 32]
+    return None if digest == NO_SEGMENT else digest
+
+def deserialize_session(blob: bytes, load_segment: Callable[[bytes], Optional[bytes]]) -> Dict:
+    if not blob.startswith(SNAPSHOT_MAGIC):
+        # Stored before the snapshot format: compressed JSON with the state as is
+        return json.loads(zlib.decompress(blob))
+
+    offset = len(SNAPSHOT_MAGIC)
+    version = blob[offset]
+    if version == 1:
+        # Version 1 carried its static segment inline, after its 4-byte length
+        length = int.from_bytes(blob[offset + 1:offset + 5], "big")
+        static = ormsgpack.unpackb(_decode_segment(blob[offset + 5:offset + 5 + length]))
+        session = ormsgpack.unpackb(blob[offset + 5 + length:])
+    elif version == SNAPSHOT_VERSION:
+        digest = blob[offset + 1:offset + 33]
+        static = None if digest == NO_SEGMENT else ormsgpack.unpackb(segment_cache.decode(digest, load_segment))
+        session = ormsgpack.unpackb(blob[offset + 33:])
+    else:
+        raise ValueError(f"Unsupported session snapshot version {version}")
+    if static is not None:
+        session["workflow_state"] = unpack_state(static, session["workflow_state"])
+    return session
+
+class SessionStore(ABC):
+    """Base class for session storage.
+
+    Sessions are stored in serialized form, so get() returns a copy and callers must
+    put() it back after changing it. Static segments are stored once per digest and
+    dropped when no session refers to them any more.
+    """
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+
+    def _expired(self, accessed_at: float) -> bool:
+        return bool(self.ttl_seconds) and time.time() - accessed_at > self.ttl_seconds
+
+    def put(self, session_id: str, session: Dict):
+        self._put(session_id, *serialize_session(session))
+
+    def _load(self, blob: bytes) -> Dict:
+        return deserialize_session(blob, self._get_segment)
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def _put(self, session_id: str, blob: bytes, digest: Optional[bytes], segment: Optional[bytes]):
+        ...
+
+    @abstractmethod
+    def _get_segment(self, digest: bytes) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+class MemorySessionStore(SessionStore):
+    """In-process store with TTL, LRU eviction and a byte budget over the serialized sessions
+    and their static segments"""
+
+    def __init__(self, max_entries: int = SESSION_MAX_ENTRIES,
+                 memory_budget_bytes: int = int(SESSION_MEMORY_BUDGET_MB * 1024 * 1024), **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self.memory_budget_bytes = memory_budget_bytes
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()   # id -> (blob, accessed_at)
+        self.segments: Dict[bytes, list] = {}                      # digest -> [segment, sessions]
+        self.size_bytes = 0
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        entry = self.entries.get(session_id)
+        if entry is None:
+            return None
+        if self._expired(entry[1]):
+            self.delete(session_id)
+            return None
+
+        self.entries[session_id] = (entry[0], time.time())
+        self.entries.move_to_end(session_id)
+        return self._load(entry[0])
+
+    def _put(self, session_id: str, blob: bytes, digest: Optional[bytes], segment: Optional[bytes]):
+        # Reference the segment before releasing the previous snapshot, which usually shares it
+        if digest is not None:
+            stored = self.segments.get(digest)
+            if stored is None:
+                stored = self.segments[digest] = [segment, 0]
+                self.size_bytes += len(segment)
+            stored[1] += 1
+        self.delete(session_id)
+        self.entries[session_id] = (blob, time.time())
+        self.size_bytes += len(blob)
+
+        # Evict least recently used sessions, never the one just stored
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_entries or self.size_bytes > self.memory_budget_bytes
+        ):
+            oldest = next(iter(self.entries))
+            self.delete(oldest)
+            self.evictions += 1
+
+    def _get_segment(self, digest: bytes) -> Optional[bytes]:
+        stored = self.segments.get(digest)
+        return stored[0] if stored else None
+
+    def delete(self, session_id: str):
+        entry = self.entries.pop(session_id, None)
+        if entry is None:
+            return
+        self.size_bytes -= len(entry[0])
+        digest = segment_digest(entry[0])
+        stored = self.segments.get(digest) if digest else None
+        if stored is not None:
+            stored[1] -= 1
+            if not stored[1]:
+                del self.segments[digest]
+                self.size_bytes -= len(stored[0])
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class SQLiteSessionStore(SessionStore):
+    """Store in a SQLite file, so all workers on one host share sessions. Static segments
+    are kept in their own table, one row per digest, and purged with the sessions."""
+
+    # Expired / excess sessions are purged every this many writes
+    PURGE_EVERY = 100
+
+    def __init__(self, db_path: str = SESSION_DB, max_entries: int = SESSION_MAX_ENTRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(session_id TEXT PRIMARY KEY, data BLOB NOT NULL, accessed_at REAL NOT NULL, segment BLOB)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        if "segment" not in columns:
+            # Database created before static segments were stored separately
+            self._db.execute("ALTER TABLE sessions ADD COLUMN segment BLOB")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_accessed_at ON sessions (accessed_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_segment ON sessions (segment)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS segments (digest BLOB PRIMARY KEY, data BLOB NOT NULL)")
+        self._db.commit()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, accessed_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1]):
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+                return None
+
+            self._db.execute("UPDATE sessions SET accessed_at = ? WHERE session_id = ?", (time.time(), session_id))
+            self._db.commit()
+        return self._load(row[0])
+
+    def _put(self, session_id: str, blob: bytes, digest: Optional[bytes], segment: Optional[bytes]):
+        with self._lock:
+            # Same transaction as the session, so a concurrent purge cannot drop the segment in between
+            if digest is not None:
+                self._db.execute("INSERT OR IGNORE INTO segments (digest, data) VALUES (?, ?)", (digest, segment))
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, accessed_at, segment) VALUES (?, ?, ?, ?)",
+                (session_id, blob, time.time(), digest)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._purge()
+            self._db.commit()
+
+    def _purge(self):
+        deleted = 0
+        if self.ttl_seconds:
+            deleted += self._db.execute(
+                "DELETE FROM sessions WHERE accessed_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+        deleted += self._db.execute(
+            "DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM sessions "
+            "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        ).rowcount
+        self.evictions += deleted
+        self._db.execute(
+            "DELETE FROM segments WHERE NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.segment = segments.digest)"
+        )
+
+    def _get_segment(self, digest: bytes) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM segments WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+def create_session_store() -> SessionStore:
+    """Session store selected by the SESSION_STORE environment variable"""
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore()
+    if SESSION_STORE == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE}")
@@ -15,34 +15,48 @@ document.getElementById('fileInput').addEventListener('change', async (e) => {
     try {
         showLoading('Analyzing document...');
         
-        const response = await fetch('/api/upload', {
+        // Streamed: the first question appears token by token while it is generated
+        const response = await fetch('/api/upload/stream', {
             method: 'POST',
             body: formData
         });
         
-        const data = await response.json();
-
-        if (!response.ok) throw new Error(data.detail);
+        if (!response.ok) throw new Error((await response.json()).detail);
 
-        sessionId = data.session_id;
-        currentPlaceholder = data.current_placeholder;
+        let bubble = null;
+        const showChat = () => {
+            if (bubble) return;
+            document.getElementById('upload-section').classList.add('hidden');
+            document.getElementById('chat-section').classList.remove('hidden');
+            bubble = addMessage('', 'assistant');
+        };
 
-        document.getElementById('upload-section').classList.add('hidden');
-        document.getElementById('chat-section').classList.remove('hidden');
+        await readEvents(response, (event, data) => {
+            if (event === 'token') {
+                showChat();
+                bubble.textContent += data.text;
+            } else if (event === 'question') {
+                showChat();
+                bubble.textContent = data.first_question;
 
-        document.getElementById('userInput').disabled = false;
-        document.getElementById('sendBtn').disabled = false;
+                sessionId = data.session_id;
+                currentPlaceholder = data.current_placeholder;
 
-        addMessage(data.first_question, 'assistant');
+                document.getElementById('userInput').disabled = false;
+                document.getElementById('sendBtn').disabled = false;
 
-        // Update progress - handle both formats
-        if (data.progress) {
-            const [current, total] = data.progress.split('/');
-            updateProgress(parseInt(current), parseInt(total));
-        } else {
-            // Fallback if progress not in response
-            updateProgress(1, data.total_placeholders);
-        }
+                // Update progress - handle both formats
+                if (data.progress) {
+                    const [current, total] = data.progress.split('/');
+                    updateProgress(parseInt(current), parseInt(total));
+                } else {
+                    // Fallback if progress not in response
+                    updateProgress(1, data.total_placeholders);
+                }
+            } else if (event === 'error') {
+                throw new Error(data.detail);
+            }
+        });
         
     } catch (error) {
         alert('Error: ' + error.message);
@@ -60,7 +74,8 @@ async function sendMessage() {
     input.value = '';
     
     try {
-        const response = await fetch('/api/chat', {
+        // Streamed: the next question is shown token by token while it is generated
+        const response = await fetch('/api/chat/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -70,18 +85,31 @@ async function sendMessage() {
             })
         });
         
-        const data = await response.json();
+        if (!response.ok) throw new Error((await response.json()).detail);
         
-        if (data.type === 'validation_error') {
-            addMessage(data.message, 'assistant');
-        } else if (data.type === 'next_question') {
-            currentPlaceholder = data.current_placeholder;
-            addMessage(data.question, 'assistant');
-            updateProgress(...data.progress.split('/'));
-        } else if (data.type === 'complete') {
-            addMessage(data.message, 'assistant');
-            await generateDocumentPreview();
-        }
+        let bubble = null;
+        let complete = false;
+        
+        await readEvents(response, (event, data) => {
+            if (event === 'token') {
+                bubble = bubble || addMessage('', 'assistant');
+                bubble.textContent += data.text;
+            } else if (event === 'validation_error') {
+                addMessage(data.message, 'assistant');
+            } else if (event === 'next_question') {
+                currentPlaceholder = data.current_placeholder;
+                bubble = bubble || addMessage('', 'assistant');
+                bubble.textContent = data.question;
+                updateProgress(...data.progress.split('/'));
+            } else if (event === 'complete') {
+                addMessage(data.message, 'assistant');
+                complete = true;
+            } else if (event === 'error') {
+                throw new Error(data.detail);
+            }
+        });
+        
+        if (complete) await generateDocumentPreview();
         
     } catch (error) {
         addMessage('Error: ' + error.message, 'assistant');
@@ -155,7 +183,7 @@ async function saveEdits() {
     console.log('Sending updated values:', updatedValues);
     
     try {
-        const response = await fetch(`/api/update-values?session_id=${sessionId}`, {
+        const response = await fetch(`/api/update-values?session_id=${sessionId}&incremental=true`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(updatedValues)
@@ -170,8 +198,12 @@ async function saveEdits() {
         
         console.log('Update response:', data);
         
-        // Update preview
-        document.getElementById('document-preview').innerHTML = data.preview_html;
+        // Update preview: patch only the changed blocks when the server sent a patch
+        if (data.preview_patch) {
+            applyPreviewPatch(data.preview_patch);
+        } else {
+            document.getElementById('document-preview').innerHTML = data.preview_html;
+        }
         
         // Update local collectedValues
         collectedValues = data.collected_values || updatedValues;
@@ -188,6 +220,14 @@ async function saveEdits() {
 }
 
 
+function applyPreviewPatch(patch) {
+    for (const [id, html] of Object.entries(patch)) {
+        const block = document.getElementById(id);
+        if (block) block.innerHTML = html;
+    }
+}
+
+
 function formatPlaceholderName(name) {
     // Convert placeholder names to readable format
     return name
@@ -195,6 +235,33 @@ function formatPlaceholderName(name) {
         .replace(/\b\w/g, l => l.toUpperCase());
 }
 
+async function readEvents(response, onEvent) {
+    // Parse a server-sent event stream from fetch (EventSource only supports GET)
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 function addMessage(text, sender) {
     const container = document.getElementById('chat-container');
     const messageDiv = document.createElement('div');
@@ -208,6 +275,7 @@ function addMessage(text, sender) {
     container.appendChild(messageDiv);
     
     container.scrollTop = container.scrollHeight;
+    return bubble;
 }
 
 function updateProgress(current, total) {
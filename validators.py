@@ -0,0 +1,214 @@
+import re
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Optional
+
+# Placeholder name words that decide which parser handles the answer
+TYPE_KEYWORDS = [
+    ("email", ["email", "e-mail", "e_mail"]),
+    ("percentage", ["percent", "percentage", "rate", "discount"]),
+    ("currency", ["amount", "price", "valuation", "cap", "investment", "purchase", "fee",
+                  "salary", "payment", "cost", "dollar", "usd", "compensation"]),
+    ("date", ["date", "dated", "day", "deadline", "expiration", "expiry"]),
+    ("address", ["address", "street", "location"]),
+    ("name", ["name", "company", "corporation", "entity", "investor", "party", "client",
+              "employer", "employee", "signatory", "founder", "buyer", "seller"]),
+]
+
+CURRENCY_SYMBOLS = {"$": "$", "usd": "$", "us$": "$", "dollars": "$", "dollar": "$",
+                    "€": "€", "eur": "€", "euro": "€", "euros": "€",
+                    "£": "£", "gbp": "£", "pounds": "£"}
+# Answers that are not a value at all ("TBD", "Not sure"); the LLM asks for a real one
+NON_ANSWERS = {"yes", "no", "y", "n", "ok", "okay", "none", "nothing", "n/a", "na", "tbd", "tba", "tbc",
+               "unknown", "not sure", "unsure", "no idea", "idk", "i don't know", "dont know", "don't know",
+               "skip", "later", "pending", "same", "same as above", "whatever", "anything", "test",
+               "both", "either", "neither", "all"}
+
+MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "m": 1_000_000, "mm": 1_000_000,
+               "million": 1_000_000, "b": 1_000_000_000, "billion": 1_000_000_000}
+
+CURRENCY_PATTERN = re.compile(
+    r'^(?P<pre>\$|€|£|usd|us\$|eur|gbp)?\s*(?P<sign>-)?\s*(?P<pre2>\$|€|£)?\s*'
+    r'(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)\s*'
+    r'(?P<mult>k|m|mm|b|thousand|million|billion)?\s*'
+    r'(?P<post>usd|eur|gbp|dollars?|euros?|pounds)?$',
+    re.IGNORECASE
+)
+PERCENT_PATTERN = re.compile(r'^(?P<number>-?\d+(?:\.\d+)?)\s*(?:%|percent|per cent)$', re.IGNORECASE)
+EMAIL_PATTERN = re.compile(r'^[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}$')
+ADDRESS_PATTERN = re.compile(
+    r'^\d+[A-Za-z]?\s+[\w .\'\-]+\b(street|st|avenue|ave|road|rd|boulevard|blvd|lane|ln|drive|dr|'
+    r'way|court|ct|place|pl|square|sq|parkway|pkwy|highway|hwy|suite|ste)\b.*$',
+    re.IGNORECASE
+)
+NAME_PATTERN = re.compile(r"^[A-Z0-9][\w&.,'’\- ]*[\w.)]$")
+NAME_CONNECTORS = ("&", "and", "of")
+
+DATE_FORMATS = ["%B %d, %Y", "%B %d %Y", "%b %d, %Y", "%b %d %Y", "%b. %d, %Y",
+                "%d %B %Y", "%d %b %Y", "%Y-%m-%d"]
+
+def infer_type(placeholder: str, context: str = "") -> Optional[str]:
+    """Guess the value type from the placeholder name, then from the text around it"""
+    # The last word is usually the head noun ("Purchase Date" is a date, not an amount)
+    words = [w for w in re.split(r'[\s_\-]+', placeholder.lower()) if w]
+    for word in reversed(words):
+        for value_type, keywords in TYPE_KEYWORDS:
+            if word in keywords:
+                return value_type
+
+    # Keywords inside joined names ("InvestorEmail"), only as whole words:
+    # "State of Incorporation" is not a corporation name
+    lowered = re.sub(r'([a-z])([A-Z])', r'\1 \2', placeholder).lower()
+    for value_type, keywords in TYPE_KEYWORDS:
+        if any(re.search(rf'(?<![a-z]){re.escape(k)}(?![a-z])', lowered) for k in keywords):
+            return value_type
+
+    # "$[___]" or "[___]%" in the template
+    for form in (f"[{placeholder}]", f"{{{placeholder}}}", placeholder):
+        pos = context.find(form)
+        if pos == -1:
+            continue
+        if context[max(0, pos - 2):pos].strip().endswith(("$", "€", "£")):
+            return "currency"
+        if context[pos + len(form):pos + len(form) + 2].strip().startswith("%"):
+            return "percentage"
+        break
+    return None
+
+def _accept(value: str) -> Dict:
+    return {"valid": True, "formatted_value": value, "feedback": "Accepted"}
+
+def _reject(feedback: str) -> Dict:
+    return {"valid": False, "formatted_value": "", "feedback": feedback}
+
+def parse_currency(answer: str) -> Optional[Dict]:
+    match = CURRENCY_PATTERN.match(answer.strip())
+    if not match:
+        return None
+
+    number = Decimal(match.group("number").replace(",", ""))
+    multiplier = (match.group("mult") or "").lower()
+    number *= MULTIPLIERS.get(multiplier, 1)
+
+    if match.group("sign") or number <= 0:
+        return _reject("The amount must be a positive number. Please enter it again.")
+
+    # Sub-cent amounts (par values, prices per share) would be rounded; leave them to the LLM
+    if number != number.quantize(Decimal("0.01")):
+        return None
+
+    currency_word = (match.group("pre") or match.group("pre2") or match.group("post") or "$").lower()
+    symbol = CURRENCY_SYMBOLS.get(currency_word, "$")
+
+    if number == number.to_integral_value():
+        return _accept(f"{symbol}{int(number):,}")
+    return _accept(f"{symbol}{number:,.2f}")
+
+def parse_date(answer: str) -> Optional[Dict]:
+    text = re.sub(r'(\d)(st|nd|rd|th)\b', r'\1', answer.strip().rstrip("."))
+    text = " ".join(text.split())
+
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(text, date_format)
+            break
+        except ValueError:
+            continue
+    else:
+        # Numeric US dates, only when day and month cannot be swapped
+        match = re.match(r'^(\d{1,2})/(\d{1,2})/(\d{4})$', text)
+        if not match:
+            return None
+        month, day, year = (int(g) for g in match.groups())
+        if month <= 12 and day <= 12 and month != day:
+            return None
+        try:
+            parsed = datetime(year, month, day)
+        except ValueError:
+            return None
+
+    return _accept(f"{parsed.strftime('%B')} {parsed.day}, {parsed.year}")
+
+def parse_percentage(answer: str) -> Optional[Dict]:
+    match = PERCENT_PATTERN.match(answer.strip())
+    if not match:
+        return None
+
+    number = float(match.group("number"))
+    if not 0 <= number <= 100:
+        return _reject("The percentage must be between 0% and 100%. Please enter it again.")
+    return _accept(f"{number:g}%")
+
+def parse_email(answer: str) -> Optional[Dict]:
+    text = answer.strip()
+    if not EMAIL_PATTERN.match(text):
+        return None
+    local, domain = text.rsplit("@", 1)
+    return _accept(f"{local}@{domain.lower()}")
+
+def parse_address(answer: str) -> Optional[Dict]:
+    text = " ".join(answer.split())
+    if not ADDRESS_PATTERN.match(text):
+        return None
+    return _accept(text)
+
+def parse_name(answer: str) -> Optional[Dict]:
+    text = " ".join(answer.split())
+    if not 2 <= len(text) <= 120 or not NAME_PATTERN.match(text):
+        return None
+    if not any(c.isalpha() for c in text):
+        return None
+    # Names are capitalized words; leave lowercase or sentence-like answers to the LLM
+    words = [w for w in re.split(r"[\s,]+", text) if w]
+    if len(words) > 8 or not all(w[0].isupper() or w[0].isdigit() or w in NAME_CONNECTORS for w in words):
+        return None
+    # One capitalized word ("Delaware", "Both") is not clearly a name: ask for at least two
+    # name words ("Jane Doe"), an entity suffix counting as one ("Acme Inc.")
+    name_words = [w for w in words if w not in NAME_CONNECTORS and w.lower() not in NON_ANSWERS]
+    if len(name_words) < 2:
+        return None
+    return _accept(text)
+
+def is_non_answer(answer: str) -> bool:
+    """Placeholder answers like "TBD", "Yes" or "Not sure" that must not be accepted as a value"""
+    text = " ".join(re.sub(r"[.!?\s]+", " ", answer.lower().replace("’", "'")).split())
+    return text in NON_ANSWERS or text.startswith(("not sure", "no idea", "i don't know", "don't know"))
+
+PARSERS = {
+    "currency": parse_currency,
+    "date": parse_date,
+    "percentage": parse_percentage,
+    "email": parse_email,
+    "address": parse_address,
+    "name": parse_name,
+}
+
+class LocalValidator:
+    """Rule-based validation that answers obvious cases without the LLM.
+
+    validate() returns the same dict shape as the LLM validator, or None when the
+    type is unknown or the answer does not clearly parse, in which case the caller
+    falls back to the LLM.
+    """
+
+    def __init__(self):
+        self.attempts = 0
+        self.answered = 0
+
+    def validate(self, placeholder: str, answer: str, context: str = "") -> Optional[Dict]:
+        self.attempts += 1
+        value_type = infer_type(placeholder, context)
+        if not value_type or not answer.strip() or is_non_answer(answer):
+            return None
+
+        result = PARSERS[value_type](answer)
+        if result is not None:
+            self.answered += 1
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "attempts": self.attempts,
+            "answered_locally": self.answered,
+            "llm_avoidance_rate": self.answered / self.attempts if self.attempts else 0.0
+        }